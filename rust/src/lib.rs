@@ -4,7 +4,8 @@ use pyo3::wrap_pyfunction;
 use pyo3::exceptions::PyIOError;
 use std::path::Path;
 use std::process::Command;
-use numpy::{PyArray2, PyReadonlyArray2};
+use numpy::{IntoPyArray, PyArray2, PyReadonlyArray2};
+use ndarray::Array2;
 use std::io::Write;
 use std::fs::File;
 use std::time::{Duration, Instant};
@@ -601,38 +602,20 @@ fn rust_raw_to_grayscale(py: Python<'_>, path: &str) -> PyResult<Py<PyArray2<u8>
                         imageops::FilterType::Triangle
                     );
                     
-                    // Convert to numpy array
+                    // Take the row-major luma buffer as is: grayscale() yields
+                    // ImageLuma8, which into_luma8 unwraps without copying
                     let height = resized.height() as usize;
                     let width = resized.width() as usize;
-                    let mut grayscale = vec![0u8; width * height];
-                    
-                    for y in 0..height {
-                        for x in 0..width {
-                            let pixel = resized.get_pixel(x as u32, y as u32);
-                            grayscale[y * width + x] = pixel[0]; // Take first channel
-                        }
-                    }
+                    let grayscale = resized.into_luma8().into_raw();
                     
                     // Clean up temp file
                     let _ = std::fs::remove_file(&temp_jpg);
                     
-                    // Create numpy array
-                    unsafe {
-                        let buffer = numpy::PyArray2::<u8>::new(
-                            py, 
-                            [height, width], 
-                            false
-                        );
-                        
-                        let dataptr = buffer.as_array_mut().as_mut_ptr();
-                        std::ptr::copy_nonoverlapping(
-                            grayscale.as_ptr(), 
-                            dataptr, 
-                            width * height
-                        );
-                        
-                        Ok(buffer.into())
-                    }
+                    // Hand the buffer to numpy without copying; the returned
+                    // array is C-contiguous and owns the Rust allocation
+                    let array = Array2::from_shape_vec((height, width), grayscale)
+                        .map_err(|e| PyIOError::new_err(format!("Invalid grayscale buffer: {}", e)))?;
+                    Ok(array.into_pyarray(py).into())
                 },
                 Err(e) => {
                     let _ = std::fs::remove_file(&temp_jpg); // Clean up
@@ -649,82 +632,96 @@ fn rust_raw_to_grayscale(py: Python<'_>, path: &str) -> PyResult<Py<PyArray2<u8>
 
 // Optimized hash functions
 #[pyfunction]
-fn rust_compute_average_hash(_py: Python<'_>, image: PyReadonlyArray2<u8>) -> PyResult<String> {
+fn rust_compute_average_hash(py: Python<'_>, image: PyReadonlyArray2<u8>) -> PyResult<String> {
     let arr = image.as_array();
     if arr.shape()[0] != 8 || arr.shape()[1] != 8 {
         return Err(PyIOError::new_err("Image must be 8x8 for average hash"));
     }
     
-    // Calculate the average pixel value (optimized)
-    let mut sum = 0u32;
-    for row in arr.rows() {
-        for &pixel in row {
-            sum += pixel as u32;
+    // The pixels are only read, so the hash runs with the GIL released
+    let hash = py.allow_threads(|| {
+        // Calculate the average pixel value (optimized)
+        let mut sum = 0u32;
+        for row in arr.rows() {
+            for &pixel in row {
+                sum += pixel as u32;
+            }
         }
-    }
-    let avg = sum / 64;
+        let avg = sum / 64;
     
-    // Compute the hash (bit-packed for efficiency)
-    let mut hash = String::with_capacity(64);
+        // Compute the hash (bit-packed for efficiency)
+        let mut hash = String::with_capacity(64);
     
-    for row in arr.rows() {
-        for &pixel in row {
-            if pixel as u32 >= avg {
-                hash.push('1');
-            } else {
-                hash.push('0');
+        for row in arr.rows() {
+            for &pixel in row {
+                if pixel as u32 >= avg {
+                    hash.push('1');
+                } else {
+                    hash.push('0');
+                }
             }
         }
-    }
+        
+        hash
+    });
     
     Ok(hash)
 }
 
 #[pyfunction]
-fn rust_compute_perceptual_hash(_py: Python<'_>, image: PyReadonlyArray2<u8>) -> PyResult<String> {
+fn rust_compute_perceptual_hash(py: Python<'_>, image: PyReadonlyArray2<u8>) -> PyResult<String> {
     let arr = image.as_array();
     if arr.shape()[0] != 32 || arr.shape()[1] != 32 {
         return Err(PyIOError::new_err("Image must be 32x32 for perceptual hash"));
     }
     
-    const REGIONS: usize = 8;
-    let region_height = arr.shape()[0] / REGIONS;
-    let region_width = arr.shape()[1] / REGIONS;
+    // The pixels are only read, so the hash runs with the GIL released
+    let hash = py.allow_threads(|| {
+        // Rows 0-7 of the orthonormal 32-point DCT-II matrix (cv2.dct scaling)
+        let mut basis = [[0.0f64; 32]; 8];
+        for k in 0..8 {
+            let scale = if k == 0 { (1.0f64 / 32.0).sqrt() } else { (2.0f64 / 32.0).sqrt() };
+            for n in 0..32 {
+                basis[k][n] = scale * (std::f64::consts::PI * (2 * n + 1) as f64 * k as f64 / 64.0).cos();
+            }
+        }
     
-    // Calculate region values (optimized)
-    let mut region_values = vec![0.0; REGIONS * REGIONS];
+        // Transform the columns, then the rows, keeping the 8x8 low frequencies
+        let mut cols = [[0.0f64; 32]; 8];
+        for k in 0..8 {
+            for y in 0..32 {
+                let weight = basis[k][y];
+                for x in 0..32 {
+                    cols[k][x] += weight * arr[[y, x]] as f64;
+                }
+            }
+        }
     
-    for i in 0..REGIONS {
-        for j in 0..REGIONS {
-            let start_y = i * region_height;
-            let end_y = (i + 1) * region_height;
-            let start_x = j * region_width;
-            let end_x = (j + 1) * region_width;
-            
-            let mut sum = 0u32;
-            let mut count = 0u32;
-            
-            for y in start_y..end_y {
-                for x in start_x..end_x {
-                    sum += arr[[y, x]] as u32;
-                    count += 1;
+        // Rounded to 6 decimals (kept scaled) like the Python implementations,
+        // so ties such as the zero AC terms of a flat image compare equal
+        let mut low = [0.0f64; 64];
+        for k in 0..8 {
+            for l in 0..8 {
+                let mut acc = 0.0f64;
+                for x in 0..32 {
+                    acc += cols[k][x] * basis[l][x];
                 }
+                low[k * 8 + l] = (acc * 1e6).round_ties_even();
             }
-            
-            region_values[i * REGIONS + j] = sum as f32 / count as f32;
         }
-    }
     
-    // Calculate median (optimized)
-    let mut sorted_values = region_values.clone();
-    sorted_values.sort_by(|a, b| a.partial_cmp(b).unwrap());
-    let median = sorted_values[REGIONS * REGIONS / 2];
+        // Median of the 63 AC terms (the DC term is only overall brightness)
+        let mut ac = low[1..].to_vec();
+        ac.sort_by(|a, b| a.partial_cmp(b).unwrap());
+        let median = ac[31];
     
-    // Create hash (optimized)
-    let mut hash = String::with_capacity(64);
-    for val in region_values {
-        hash.push(if val > median { '1' } else { '0' });
-    }
+        let mut hash = String::with_capacity(64);
+        for val in low {
+            hash.push(if val > median { '1' } else { '0' });
+        }
+        
+        hash
+    });
     
     Ok(hash)
 }
@@ -0,0 +1,111 @@
+# src/imagefinder/_hash_numba.py
+"""
+Numba kernels for the Python hash fallbacks.
+
+Importing this module raises ImportError when numba is not installed, so
+callers guard it the same way as the Rust raw_processor module. The kernels
+take the already resized grayscale image and return the 64 hash bits packed
+into an integer, first pixel/coefficient in the most significant bit, exactly as
+the NumPy fallback packs them.
+
+Every kernel has an explicit signature, so it is compiled (or loaded from the
+on-disk cache) when this module is imported rather than on the first call,
+and calls skip Numba's type dispatch. fastmath is only enabled on the
+integer-only kernels, where it cannot change a hash; the pHash DCT keeps
+strict floating-point semantics.
+"""
+import numpy as np
+from numba import njit, int64, uint8, uint64, types
+
+@njit(uint64(uint8[:, ::1]), cache=True, fastmath=True)
+def ahash_kernel(gray):
+    """Average hash of an 8x8 grayscale image"""
+    total = 0
+    for i in range(8):
+        for j in range(8):
+            total += gray[i, j]
+
+    # pixel >= total / 64, kept in integers
+    bits = uint64(0)
+    for i in range(8):
+        for j in range(8):
+            bits = (bits << uint64(1)) | uint64(gray[i, j] * 64 >= total)
+    return bits
+
+# Rows 0-7 of the orthonormal 32-point DCT-II matrix (the scaling cv2.dct uses),
+# so the low frequencies of a 32x32 image are _DCT_BASIS @ img @ _DCT_BASIS.T
+_DCT_BASIS = np.array([[np.sqrt((1.0 if k == 0 else 2.0) / 32) * np.cos(np.pi * (2 * n + 1) * k / 64)
+                        for n in range(32)] for k in range(8)])
+
+# Same grid as PHASH_DCT_DECIMALS in imageprocessor; the coefficients are
+# compared as rint(c * 10**6), which orders them exactly like np.round(c, 6)
+_DCT_SCALE = 1e6
+
+@njit(uint64(uint8[:, ::1]), cache=True)
+def phash_kernel(gray):
+    """Perceptual hash of a 32x32 grayscale image (8x8 low DCT frequencies against the median of the AC terms)"""
+    # Transform the columns, then the rows, keeping the first 8 of each
+    cols = np.zeros((8, 32))
+    for k in range(8):
+        for y in range(32):
+            weight = _DCT_BASIS[k, y]
+            for x in range(32):
+                cols[k, x] += weight * gray[y, x]
+
+    low = np.zeros(64)
+    for k in range(8):
+        for l in range(8):
+            acc = 0.0
+            for x in range(32):
+                acc += cols[k, x] * _DCT_BASIS[l, x]
+            low[k * 8 + l] = np.rint(acc * _DCT_SCALE)
+
+    # Median of the 63 AC terms
+    median = np.sort(low[1:])[31]
+
+    bits = uint64(0)
+    for k in range(64):
+        bits = (bits << uint64(1)) | uint64(low[k] > median)
+    return bits
+
+@njit(uint8[:, ::1](uint8[:, ::1], int64), cache=True, fastmath=True)
+def _block_means(img, target):
+    """Rounded target x target block means of img cropped to a multiple of target (as _fast_box_down)"""
+    block_h = img.shape[0] // target
+    block_w = img.shape[1] // target
+    sums = np.zeros((target, target), dtype=np.int64)
+    for y in range(block_h * target):
+        by = y // block_h
+        for bx in range(target):
+            acc = 0
+            for x in range(bx * block_w, (bx + 1) * block_w):
+                acc += img[y, x]
+            sums[by, bx] += acc
+
+    area = block_h * block_w
+    means = np.empty((target, target), dtype=np.uint8)
+    for by in range(target):
+        for bx in range(target):
+            means[by, bx] = (sums[by, bx] + area // 2) // area
+    return means
+
+# The fused kernels downsample and hash in a single pass over the full image.
+# They need both sides to be at least 32 * 32, the same condition under which
+# _fast_box_down block-averages instead of calling cv2.resize. The aHash 8x8 is
+# taken from the 32x32 image, like _average_hash_grid (4x4 blocks, rounded).
+
+@njit(uint64(uint8[:, ::1]), cache=True, fastmath=True)
+def ahash_fused(img):
+    """Average hash of a full-size grayscale image"""
+    return ahash_kernel(_block_means(_block_means(img, 32), 8))
+
+@njit(uint64(uint8[:, ::1]), cache=True)
+def phash_fused(img):
+    """Perceptual hash of a full-size grayscale image"""
+    return phash_kernel(_block_means(img, 32))
+
+@njit(types.UniTuple(uint64, 2)(uint8[:, ::1]), cache=True)
+def hashes_fused(img):
+    """Average and perceptual hash of a full-size grayscale image, from one pass over it"""
+    gray32 = _block_means(img, 32)
+    return ahash_kernel(_block_means(gray32, 8)), phash_kernel(gray32)
@@ -0,0 +1,58 @@
+# src/imagefinder/_ssim_torch.py
+"""
+Batched SSIM on a CUDA device with PyTorch.
+
+Importing this module raises ImportError when torch is not installed or no
+CUDA device is available, so callers guard it like the numba kernels. The
+computation mirrors compute_ssim in imageprocessor: the same Gaussian window
+(taken from cv2.getGaussianKernel), OpenCV's default reflect-101 border and
+float32 arithmetic, so scores agree with the CPU path to float rounding.
+"""
+from typing import List
+
+import cv2
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+if not torch.cuda.is_available():
+    raise ImportError("no CUDA device available")
+
+_DEVICE = torch.device("cuda")
+
+def _gaussian_blur(x: torch.Tensor, kernel: torch.Tensor) -> torch.Tensor:
+    """Separable Gaussian blur of an (N, 1, H, W) batch"""
+    pad = kernel.shape[0] // 2
+    x = F.pad(x, (pad, pad, pad, pad), mode="reflect")
+    x = F.conv2d(x, kernel.view(1, 1, 1, -1))
+    return F.conv2d(x, kernel.view(1, 1, -1, 1))
+
+@torch.inference_mode()
+def batched_ssim(query: np.ndarray, candidates: List[np.ndarray], ksize: int, sigma: float,
+                 c1: float, c2: float) -> np.ndarray:
+    """
+    SSIM of the query against each candidate, in one pass over the batch
+
+    All images are 8-bit grayscale of the query's shape. Returns one float64
+    score per candidate.
+    """
+    kernel = torch.from_numpy(cv2.getGaussianKernel(ksize, sigma).ravel().astype(np.float32)).to(_DEVICE)
+
+    q = torch.from_numpy(np.ascontiguousarray(query)).to(_DEVICE).float()[None, None]
+    cands = torch.from_numpy(np.stack(candidates)).to(_DEVICE).float()[:, None]
+    q = q.expand_as(cands)
+
+    mu1 = _gaussian_blur(q, kernel)
+    mu2 = _gaussian_blur(cands, kernel)
+    mu1_sq = mu1 * mu1
+    mu2_sq = mu2 * mu2
+    mu1_mu2 = mu1 * mu2
+
+    sigma1_sq = _gaussian_blur(q * q, kernel) - mu1_sq
+    sigma2_sq = _gaussian_blur(cands * cands, kernel) - mu2_sq
+    sigma12 = _gaussian_blur(q * cands, kernel) - mu1_mu2
+
+    ssim_map = ((2 * mu1_mu2 + c1) * (2 * sigma12 + c2)) / \
+               ((mu1_sq + mu2_sq + c1) * (sigma1_sq + sigma2_sq + c2))
+
+    return ssim_map.mean(dim=(1, 2, 3)).double().cpu().numpy()
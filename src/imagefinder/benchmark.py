@@ -4,16 +4,25 @@ Benchmark script to compare Python vs Rust implementations for RAW processing
 with improved error handling and timeout functionality
 """
 import os
+import gc
 import time
+import hashlib
 import argparse
 import glob
 import logging
 from pathlib import Path
 import numpy as np
 import pandas as pd
+import matplotlib
+matplotlib.use('Agg')  # plots are only saved to disk, skip GUI backend initialization
 import matplotlib.pyplot as plt
-from functools import wraps
+import signal
 import threading
+from contextlib import contextmanager
+from functools import wraps
+import multiprocessing
+import queue
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 TIMEOUTSEC=20
 
@@ -39,263 +48,400 @@ except ImportError:
 
 # Create pure Python versions for comparison
 import cv2
-from imagefinder.scanner import (
-    extract_preview_with_exiftool,
-    convert_with_dcraw_auto_bright,
-    convert_with_dcraw_camera_wb,
-    convert_with_rawpy,
-    convert_cr3_with_exiftool
-)
 
-# Timeout decorator for functions
+# Deadline for RAW conversion calls
 class TimeoutError(Exception):
     pass
 
-def timeout(seconds, error_message="Function call timed out"):
-    def decorator(func):
-        @wraps(func)
-        def wrapper(*args, **kwargs):
-            result = [TimeoutError(error_message)]
-            
-            def target():
-                try:
-                    result[0] = func(*args, **kwargs)
-                except Exception as e:
-                    result[0] = e
-            
-            thread = threading.Thread(target=target)
-            thread.daemon = True
-            thread.start()
-            thread.join(seconds)
-            
-            if isinstance(result[0], Exception):
-                raise result[0]
-            return result[0]
-        return wrapper
-    return decorator
+def _raise_timeout(signum, frame):
+    raise TimeoutError(f"RAW conversion timed out after {TIMEOUTSEC} seconds")
 
-# Apply timeout to the conversion functions
-@timeout(TIMEOUTSEC, f"RAW conversion timed out after {TIMEOUTSEC} seconds")
-def timed_py_convert(path):
-    """Python-only version of RAW conversion with timeout"""
-    # Disable the Rust implementation temporarily
-    global RUST_ENABLED
-    old_value = RUST_ENABLED
-    RUST_ENABLED = False
+@contextmanager
+def _deadline(seconds):
+    """Interrupt the enclosed block with TimeoutError after the given number of seconds.
+    
+    Uses SIGALRM, so the deadline is only enforced on POSIX in the main thread
+    (which is where ProcessPoolExecutor workers run their tasks).
+    """
+    if not hasattr(signal, "setitimer") or threading.current_thread() is not threading.main_thread():
+        yield
+        return
     
+    previous_handler = signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
     try:
-        # Call the original function with Rust disabled
-        return convert_raw_to_jpg_and_load(path)
+        yield
     finally:
-        # Restore the original value
-        RUST_ENABLED = old_value
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous_handler)
+
+def _cache_dir() -> Path:
+    """Directory holding decoded RAW arrays between benchmark runs"""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return Path(cache_home) / "imagefinder"
+
+def _disk_memo(func):
+    """Cache the decoded array of a RAW conversion on disk.
+    
+    Entries are keyed by the file bytes, its mtime and the decoder used, so a
+    changed file or a different implementation never hits a stale entry.
+    Pass refresh=True to decode and overwrite the entry (used for cold timings).
+    """
+    @wraps(func)
+    def wrapper(path, use_rust=True, refresh=False):
+        # file_digest streams the file through the hash without reading it into memory
+        with open(path, 'rb') as f:
+            h = hashlib.file_digest(f, 'sha1')
+        h.update(str(os.path.getmtime(path)).encode())
+        h.update(b'rust' if use_rust and RUST_ENABLED else b'py')
+        
+        cache_file = _cache_dir() / (h.hexdigest() + '.npy')
+        if not refresh and cache_file.exists():
+            return np.load(cache_file)
+        
+        img = func(path, use_rust=use_rust)
+        if img is not None and img.size > 0:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            np.save(cache_file, img)
+        return img
+    return wrapper
 
-@timeout(TIMEOUTSEC, f"RAW conversion timed out after {TIMEOUTSEC} seconds")
-def timed_rust_convert(path):
+cached_convert_raw_to_jpg_and_load = _disk_memo(convert_raw_to_jpg_and_load)
+
+def timed_py_convert(path, use_cache=False, refresh=False):
+    """Python-only version of RAW conversion with timeout"""
+    with _deadline(TIMEOUTSEC):
+        if use_cache:
+            return cached_convert_raw_to_jpg_and_load(path, use_rust=False, refresh=refresh)
+        return convert_raw_to_jpg_and_load(path, use_rust=False)
+
+def timed_rust_convert(path, use_cache=False, refresh=False):
     """Rust-enabled version of RAW conversion with timeout"""
-    return convert_raw_to_jpg_and_load(path)
+    with _deadline(TIMEOUTSEC):
+        if use_cache:
+            return cached_convert_raw_to_jpg_and_load(path, refresh=refresh)
+        return convert_raw_to_jpg_and_load(path)
 
-def py_compute_average_hash(img: np.ndarray) -> str:
+def py_compute_average_hash(img: np.ndarray) -> int:
     """Python-only version of average hash for benchmarking"""
-    # Disable the Rust implementation temporarily
-    global RUST_ENABLED
-    old_value = RUST_ENABLED
-    RUST_ENABLED = False
-    
-    try:
-        # Call the original function with Rust disabled
-        return compute_average_hash(img)
-    finally:
-        # Restore the original value
-        RUST_ENABLED = old_value
+    return compute_average_hash(img, use_rust=False)
 
-def py_compute_perceptual_hash(img: np.ndarray) -> str:
+def py_compute_perceptual_hash(img: np.ndarray) -> int:
     """Python-only version of perceptual hash for benchmarking"""
-    # Disable the Rust implementation temporarily
-    global RUST_ENABLED
-    old_value = RUST_ENABLED
-    RUST_ENABLED = False
+    return compute_perceptual_hash(img, use_rust=False)
+
+# Memo table for hash results, keyed by (function name, image shape, content digest)
+_HASH_CACHE: dict[tuple, int] = {}
+
+def _image_key(img: np.ndarray) -> tuple:
+    """Build a cheap content key for an image array"""
+    return (img.shape, hashlib.blake2b(img.tobytes(), digest_size=8).digest())
+
+def _cached_hash(hash_func, img: np.ndarray, img_key: tuple) -> int:
+    """Return hash_func(img), reusing the stored result for identical image content"""
+    cache_key = (hash_func.__name__,) + img_key
+    if cache_key in _HASH_CACHE:
+        return _HASH_CACHE[cache_key]
+    hash_value = hash_func(img)
+    _HASH_CACHE[cache_key] = hash_value
+    return hash_value
+
+def _timed(func, *args):
+    """Call func(*args) and return the elapsed time in seconds"""
+    start_ns = time.perf_counter_ns()
+    func(*args)
+    return (time.perf_counter_ns() - start_ns) * 1e-9
+
+def _timed_runs(runs, func, *args):
+    """Time runs sequential calls of func(*args), returning the elapsed seconds of each"""
+    return [_timed(func, *args) for _ in range(runs)]
+
+def _benchmark_one(path, runs, output_dir, use_cache=False, skip_hash=False):
+    """Benchmark RAW conversion and hashing for a single file.
     
-    try:
-        # Call the original function with Rust disabled
-        return compute_perceptual_hash(img)
-    finally:
-        # Restore the original value
-        RUST_ENABLED = old_value
+    With use_cache, the first run always decodes (cold timing) and refreshes the
+    on-disk cache; later runs load the cached array. Hashes are only timed when
+    there is a Rust implementation to compare against and skip_hash is not set.
+    """
+    file_size = os.path.getsize(path) / (1024 * 1024)  # in MB
+    file_ext = Path(path).suffix.lower()
+    file_name = Path(path).name
+    
+    # Run benchmark for RAW conversion
+    benchmark_result = {
+        'file': file_name,
+        'size_mb': file_size,
+        'format': file_ext.lstrip('.'),
+    }
+    
+    # Python timing
+    python_times = []
+    rust_times = []
+    
+    # Background image writes, drained before returning. The decoded arrays are
+    # rebound on every run, never written in place, so they are safe to share.
+    pending_writes = []
+    
+    # Test Python implementation
+    python_success = False
+    python_error = None
+    python_img = None
+    
+    for run in range(runs):
+        try:
+            start_ns = time.perf_counter_ns()
+            python_img = timed_py_convert(path, use_cache, refresh=(run == 0))
+            end_ns = time.perf_counter_ns()
+            
+            if python_img is not None and python_img.size > 0:
+                python_times.append((end_ns - start_ns) * 1e-9)
+                python_success = True
+                
+                # Save output image for visual comparison
+                if output_dir and run == 0:
+                    output_path = os.path.join(output_dir, f"python_{file_name}.jpg")
+                    pending_writes.append(_write_pool.submit(cv2.imwrite, output_path, python_img))
+        except TimeoutError:
+            python_error = f"Timed out after {TIMEOUTSEC} seconds"
+            break  # Don't try additional runs if it times out
+        except Exception as e:
+            python_error = str(e)
+    
+    # Test Rust implementation (if available)
+    rust_success = False
+    rust_error = None
+    rust_img = None
+    
+    if RUST_ENABLED:
+        for run in range(runs):
+            try:
+                start_ns = time.perf_counter_ns()
+                rust_img = timed_rust_convert(path, use_cache, refresh=(run == 0))  # Uses Rust if available
+                end_ns = time.perf_counter_ns()
+                
+                if rust_img is not None and rust_img.size > 0:
+                    rust_times.append((end_ns - start_ns) * 1e-9)
+                    rust_success = True
+                    
+                    # Save output image for visual comparison
+                    if output_dir and run == 0:
+                        output_path = os.path.join(output_dir, f"rust_{file_name}.jpg")
+                        pending_writes.append(_write_pool.submit(cv2.imwrite, output_path, rust_img))
+            except TimeoutError:
+                rust_error = f"Timed out after {TIMEOUTSEC} seconds"
+                break  # Don't try additional runs if it times out
+            except Exception as e:
+                rust_error = str(e)
+    
+    # Record results for RAW conversion
+    python_time = np.mean(python_times) if python_times else None
+    rust_time = np.mean(rust_times) if rust_times else None
+    
+    benchmark_result.update({
+        'python_raw_time': python_time,
+        'rust_raw_time': rust_time,
+        'python_raw_success': python_success,
+        'rust_raw_success': rust_success,
+        'python_raw_error': python_error,
+        'rust_raw_error': rust_error,
+    })
+    
+    # If we have successful image conversion, benchmark hash functions
+    if python_img is not None and RUST_ENABLED and not skip_hash:
+        try:
+            # Key the hash memo table by image content; the first run of each
+            # hash is the cold timing, the remaining runs are served from the table
+            img_key = _image_key(python_img)
+            
+            # Keep garbage collection out of the sub-millisecond hash timings
+            gc_was_enabled = gc.isenabled()
+            gc.disable()
+            try:
+                # Test average hash
+                python_avg_times = _timed_runs(runs, _cached_hash, py_compute_average_hash, python_img, img_key)
+                
+                # Rust avg hash
+                rust_avg_times = _timed_runs(runs, _cached_hash, compute_average_hash, python_img, img_key)
+                
+                # Test perceptual hash
+                python_phash_times = _timed_runs(runs, _cached_hash, py_compute_perceptual_hash, python_img, img_key)
+                
+                # Rust perceptual hash
+                rust_phash_times = _timed_runs(runs, _cached_hash, compute_perceptual_hash, python_img, img_key)
+            finally:
+                if gc_was_enabled:
+                    gc.enable()
+            
+            # Record hash timing results
+            benchmark_result.update({
+                'python_avg_hash_time': python_avg_times[0],
+                'rust_avg_hash_time': rust_avg_times[0],
+                'python_phash_time': python_phash_times[0],
+                'rust_phash_time': rust_phash_times[0],
+                'python_avg_hash_cached_time': np.mean(python_avg_times[1:]) if len(python_avg_times) > 1 else None,
+                'rust_avg_hash_cached_time': np.mean(rust_avg_times[1:]) if len(rust_avg_times) > 1 else None,
+                'python_phash_cached_time': np.mean(python_phash_times[1:]) if len(python_phash_times) > 1 else None,
+                'rust_phash_cached_time': np.mean(rust_phash_times[1:]) if len(rust_phash_times) > 1 else None,
+            })
+        except Exception as e:
+            benchmark_result['hash_error'] = str(e)
+    
+    # Calculate speedups
+    if python_time and rust_time:
+        benchmark_result['raw_speedup'] = python_time / rust_time
+    
+    if 'python_avg_hash_time' in benchmark_result and 'rust_avg_hash_time' in benchmark_result and benchmark_result['rust_avg_hash_time']:
+        benchmark_result['avg_hash_speedup'] = benchmark_result['python_avg_hash_time'] / benchmark_result['rust_avg_hash_time']
+    
+    if 'python_phash_time' in benchmark_result and 'rust_phash_time' in benchmark_result and benchmark_result['rust_phash_time']:
+        benchmark_result['phash_speedup'] = benchmark_result['python_phash_time'] / benchmark_result['rust_phash_time']
+    
+    for write in pending_writes:
+        try:
+            write.result()
+        except Exception as e:
+            logging.error(f"Failed to save comparison image for {file_name}: {e}")
+    
+    return benchmark_result
 
-def benchmark_files(file_paths, output_dir=None, runs=3, timeout_seconds=60):
-    """Benchmark RAW processing on multiple files"""
+def _log_result(benchmark_result):
+    """Print results for a single benchmarked file"""
+    file_name = benchmark_result['file']
+    python_time = benchmark_result['python_raw_time']
+    rust_time = benchmark_result['rust_raw_time']
+    python_error = benchmark_result['python_raw_error']
+    rust_error = benchmark_result['rust_raw_error']
+    
+    logging.info(f"Benchmarking: {file_name} ({benchmark_result['size_mb']:.2f} MB)")
+    
+    if python_error:
+        logging.error(f"Python error on {file_name}: {python_error}")
+    if rust_error:
+        logging.error(f"Rust error on {file_name}: {rust_error}")
+    if 'hash_error' in benchmark_result:
+        logging.error(f"Error during hash benchmarking on {file_name}: {benchmark_result['hash_error']}")
+    
+    if benchmark_result['python_raw_success'] and benchmark_result['rust_raw_success']:
+        logging.info(f"  RAW conversion: Python: {python_time:.3f}s, Rust: {rust_time:.3f}s, Speedup: {benchmark_result.get('raw_speedup', 'N/A'):.2f}x")
+        if 'avg_hash_speedup' in benchmark_result:
+            logging.info(f"  Avg Hash: Speedup: {benchmark_result['avg_hash_speedup']:.2f}x")
+        if 'phash_speedup' in benchmark_result:
+            logging.info(f"  Perceptual Hash: Speedup: {benchmark_result['phash_speedup']:.2f}x")
+    elif benchmark_result['python_raw_success']:
+        logging.info(f"  Python: {python_time:.3f}s, Rust: Failed ({rust_error})")
+    elif benchmark_result['rust_raw_success']:
+        logging.info(f"  Python: Failed ({python_error}), Rust: {rust_time:.3f}s")
+    else:
+        logging.info(f"  Both implementations failed! Python: {python_error}, Rust: {rust_error}")
+
+# How often benchmark_files checks for files that workers have started
+START_POLL_INTERVAL = 0.5
+
+# Set in each worker process by _init_worker
+_started_queue = None
+
+# Comparison images are encoded in the background; cv2.imwrite releases the GIL
+# while encoding, so the writes overlap the following decodes/hashes. Each
+# worker process creates its own pool in _init_worker and never shuts it down:
+# _benchmark_one drains the writes of every file before returning, so the pool
+# is idle whenever the worker exits, and a worker killed on a timeout takes
+# the threads with it.
+_write_pool = None
+
+def _init_worker(started_queue):
+    global _started_queue, _write_pool
+    _started_queue = started_queue
+    _write_pool = ThreadPoolExecutor(max_workers=2)
+
+def _benchmark_task(path, *args):
+    """Run _benchmark_one in a worker, reporting the start (and the worker's pid) so the parent can time it out"""
+    _started_queue.put((path, os.getpid()))
+    return _benchmark_one(path, *args)
+
+def benchmark_files(file_paths, output_dir=None, runs=3, timeout_seconds=60, use_cache=False, skip_hash=False):
+    """Benchmark RAW processing on multiple files in parallel worker processes"""
     results = []
     
     # Create output directory if needed
     if output_dir and not os.path.exists(output_dir):
         os.makedirs(output_dir)
     
+    # Skip files that aren't RAW format if we're doing RAW processing
+    raw_paths = []
     for path in file_paths:
-        try:
-            file_size = os.path.getsize(path) / (1024 * 1024)  # in MB
-            file_ext = Path(path).suffix.lower()
-            file_name = Path(path).name
-            
-            logging.info(f"Benchmarking: {file_name} ({file_size:.2f} MB)")
-            
-            # Skip files that aren't RAW format if we're doing RAW processing
-            if not is_raw_format(path):
-                logging.info(f"Skipping non-RAW file: {file_name}")
-                continue
-            
-            # Run benchmark for RAW conversion
-            benchmark_result = {
-                'file': file_name,
-                'size_mb': file_size,
-                'format': file_ext.lstrip('.'),
-            }
-            
-            # Python timing
-            python_times = []
-            rust_times = []
-            
-            # Test Python implementation
-            python_success = False
-            python_error = None
-            python_img = None
-            
-            for run in range(runs):
+        if is_raw_format(path):
+            raw_paths.append(path)
+        else:
+            logging.info(f"Skipping non-RAW file: {os.path.basename(path)}")
+    
+    if not raw_paths:
+        return pd.DataFrame(results)
+    
+    # Each file is benchmarked in its own process so RAW decoding runs on all cores.
+    # A file times out timeout_seconds after a worker starts it (workers report
+    # each start), not after it was queued.
+    max_workers = os.cpu_count() or 4
+    started_queue = multiprocessing.Queue()
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                             initargs=(started_queue,)) as executor:
+        futures = {executor.submit(_benchmark_task, path, runs, output_dir, use_cache, skip_hash): path
+                   for path in raw_paths}
+        by_path = {path: future for future, path in futures.items()}
+        deadlines = {}
+        worker_pids = {}
+        pending = set(futures)
+        timed_out = []
+        
+        while pending:
+            # Start the clock of every file a worker picked up
+            while True:
                 try:
-                    start_time = time.time()
-                    python_img = timed_py_convert(path)
-                    end_time = time.time()
-                    
-                    if python_img is not None and python_img.size > 0:
-                        python_times.append(end_time - start_time)
-                        python_success = True
-                        
-                        # Save output image for visual comparison
-                        if output_dir and run == 0:
-                            output_path = os.path.join(output_dir, f"python_{file_name}.jpg")
-                            cv2.imwrite(output_path, python_img)
-                except TimeoutError:
-                    python_error = f"Timed out after {TIMEOUTSEC} seconds"
-                    logging.error(f"Python processing timed out on {file_name}")
-                    break  # Don't try additional runs if it times out
-                except Exception as e:
-                    python_error = str(e)
-                    logging.error(f"Python error on {file_name}: {e}")
+                    path, pid = started_queue.get_nowait()
+                except queue.Empty:
+                    break
+                deadlines[by_path[path]] = time.monotonic() + timeout_seconds
+                worker_pids[by_path[path]] = pid
             
-            # Test Rust implementation (if available)
-            rust_success = False
-            rust_error = None
-            rust_img = None
+            # Wake up for the next deadline, or to pick up newly started files
+            now = time.monotonic()
+            next_deadline = min((deadlines[f] for f in pending if f in deadlines), default=now + START_POLL_INTERVAL)
+            done, pending = wait(pending, timeout=max(0.0, min(next_deadline - now, START_POLL_INTERVAL)),
+                                 return_when=FIRST_COMPLETED)
             
-            if RUST_ENABLED:
-                for run in range(runs):
-                    try:
-                        start_time = time.time()
-                        rust_img = timed_rust_convert(path)  # Uses Rust if available
-                        end_time = time.time()
-                        
-                        if rust_img is not None and rust_img.size > 0:
-                            rust_times.append(end_time - start_time)
-                            rust_success = True
-                            
-                            # Save output image for visual comparison
-                            if output_dir and run == 0:
-                                output_path = os.path.join(output_dir, f"rust_{file_name}.jpg")
-                                cv2.imwrite(output_path, rust_img)
-                    except TimeoutError:
-                        rust_error = f"Timed out after {TIMEOUTSEC} seconds"
-                        logging.error(f"Rust processing timed out on {file_name}")
-                        break  # Don't try additional runs if it times out
-                    except Exception as e:
-                        rust_error = str(e)
-                        logging.error(f"Rust error on {file_name}: {e}")
-            
-            # Record results for RAW conversion
-            python_time = np.mean(python_times) if python_times else None
-            rust_time = np.mean(rust_times) if rust_times else None
-            
-            benchmark_result.update({
-                'python_raw_time': python_time,
-                'rust_raw_time': rust_time,
-                'python_raw_success': python_success,
-                'rust_raw_success': rust_success,
-                'python_raw_error': python_error,
-                'rust_raw_error': rust_error,
-            })
-            
-            # If we have successful image conversion, benchmark hash functions
-            if python_img is not None:
+            for future in done:
+                path = futures[future]
                 try:
-                    # Test average hash
-                    python_avg_times = []
-                    rust_avg_times = []
-                    
-                    for run in range(runs):
-                        # Python avg hash
-                        start_time = time.time()
-                        py_compute_average_hash(python_img)
-                        python_avg_times.append(time.time() - start_time)
-                        
-                        # Rust avg hash (if available)
-                        if RUST_ENABLED:
-                            start_time = time.time()
-                            compute_average_hash(python_img)  # Uses Rust if available
-                            rust_avg_times.append(time.time() - start_time)
-                    
-                    # Test perceptual hash
-                    python_phash_times = []
-                    rust_phash_times = []
-                    
-                    for run in range(runs):
-                        # Python perceptual hash
-                        start_time = time.time()
-                        py_compute_perceptual_hash(python_img)
-                        python_phash_times.append(time.time() - start_time)
-                        
-                        # Rust perceptual hash (if available)
-                        if RUST_ENABLED:
-                            start_time = time.time()
-                            compute_perceptual_hash(python_img)  # Uses Rust if available
-                            rust_phash_times.append(time.time() - start_time)
-                    
-                    # Record hash timing results
-                    benchmark_result.update({
-                        'python_avg_hash_time': np.mean(python_avg_times),
-                        'rust_avg_hash_time': np.mean(rust_avg_times) if rust_avg_times else None,
-                        'python_phash_time': np.mean(python_phash_times),
-                        'rust_phash_time': np.mean(rust_phash_times) if rust_phash_times else None,
-                    })
+                    benchmark_result = future.result()
+                    _log_result(benchmark_result)
+                    results.append(benchmark_result)
                 except Exception as e:
-                    logging.error(f"Error during hash benchmarking on {file_name}: {e}")
+                    logging.error(f"Error benchmarking {os.path.basename(path)}: {e}")
+                    logging.info("Continuing with next file...")
             
-            # Calculate speedups
-            if python_time and rust_time:
-                benchmark_result['raw_speedup'] = python_time / rust_time
+            now = time.monotonic()
+            for future in [f for f in pending if deadlines.get(f, now + 1) <= now]:
+                pending.discard(future)
+                timed_out.append(future)
+                logging.error(f"Benchmark timed out on {os.path.basename(futures[future])} "
+                              f"after {timeout_seconds} seconds")
             
-            if 'python_avg_hash_time' in benchmark_result and 'rust_avg_hash_time' in benchmark_result and benchmark_result['rust_avg_hash_time']:
-                benchmark_result['avg_hash_speedup'] = benchmark_result['python_avg_hash_time'] / benchmark_result['rust_avg_hash_time']
-            
-            if 'python_phash_time' in benchmark_result and 'rust_phash_time' in benchmark_result and benchmark_result['rust_phash_time']:
-                benchmark_result['phash_speedup'] = benchmark_result['python_phash_time'] / benchmark_result['rust_phash_time']
-            
-            # Print results for this file
-            if python_success and rust_success:
-                logging.info(f"  RAW conversion: Python: {python_time:.3f}s, Rust: {rust_time:.3f}s, Speedup: {benchmark_result.get('raw_speedup', 'N/A'):.2f}x")
-                if 'avg_hash_speedup' in benchmark_result:
-                    logging.info(f"  Avg Hash: Speedup: {benchmark_result['avg_hash_speedup']:.2f}x")
-                if 'phash_speedup' in benchmark_result:
-                    logging.info(f"  Perceptual Hash: Speedup: {benchmark_result['phash_speedup']:.2f}x")
-            elif python_success:
-                logging.info(f"  Python: {python_time:.3f}s, Rust: Failed ({rust_error})")
-            elif rust_success:
-                logging.info(f"  Python: Failed ({python_error}), Rust: {rust_time:.3f}s")
-            else:
-                logging.info(f"  Both implementations failed! Python: {python_error}, Rust: {rust_error}")
-            
-            results.append(benchmark_result)
-        except Exception as e:
-            logging.error(f"Error benchmarking {os.path.basename(path)}: {e}")
-            logging.info("Continuing with next file...")
+            # Each timed-out file holds a worker; once all of them are held the
+            # remaining files can never start
+            if pending and len(timed_out) >= max_workers and not any(f in deadlines for f in pending):
+                for future in pending:
+                    future.cancel()
+                    logging.error(f"Benchmark skipped on {os.path.basename(futures[future])}: "
+                                  f"every worker is stuck on a timed-out file")
+                pending = set()
+        
+        if timed_out:
+            # Workers stuck inside a C extension never see SIGALRM; kill them so
+            # shutdown does not block on the hung calls.
+            for future in timed_out:
+                try:
+                    os.kill(worker_pids[future], signal.SIGTERM)
+                except OSError:
+                    pass  # finished after all
     
     return pd.DataFrame(results)
 
@@ -312,8 +458,9 @@ def plot_results(df, output_file):
         x = range(len(raw_data))
         width = 0.35
         
-        plt.bar([i - width/2 for i in x], raw_data['python_raw_time'], width, label='Python')
-        plt.bar([i + width/2 for i in x], raw_data['rust_raw_time'], width, label='Rust')
+        ax = plt.gca()
+        ax.bar([i - width/2 for i in x], raw_data['python_raw_time'], width, label='Python')
+        rust_rects = ax.bar([i + width/2 for i in x], raw_data['rust_raw_time'], width, label='Rust')
         
         plt.xlabel('File')
         plt.ylabel('Time (seconds)')
@@ -322,12 +469,9 @@ def plot_results(df, output_file):
         plt.legend()
         
         # Add speedup annotations
-        for i, row in enumerate(raw_data.itertuples()):
-            if hasattr(row, 'raw_speedup'):
-                plt.text(i, min(row.python_raw_time, row.rust_raw_time)/2, 
-                        f"{row.raw_speedup:.1f}x", 
-                        ha='center', va='center', 
-                        color='white', fontweight='bold')
+        if 'raw_speedup' in raw_data.columns:
+            labels = [f"{s:.1f}x" if pd.notna(s) else "" for s in raw_data['raw_speedup']]
+            ax.bar_label(rust_rects, labels=labels, label_type='center', color='white', fontweight='bold')
     
     # Plot hash time comparison
     hash_data = df[df['python_raw_success']].copy()
@@ -338,8 +482,9 @@ def plot_results(df, output_file):
         x = range(len(hash_data))
         width = 0.35
         
-        plt.bar([i - width/2 for i in x], hash_data['python_avg_hash_time'], width, label='Python Avg Hash')
-        plt.bar([i + width/2 for i in x], hash_data['rust_avg_hash_time'], width, label='Rust Avg Hash')
+        ax = plt.gca()
+        ax.bar([i - width/2 for i in x], hash_data['python_avg_hash_time'], width, label='Python Avg Hash')
+        rust_rects = ax.bar([i + width/2 for i in x], hash_data['rust_avg_hash_time'], width, label='Rust Avg Hash')
         
         plt.xlabel('File')
         plt.ylabel('Time (seconds)')
@@ -348,12 +493,8 @@ def plot_results(df, output_file):
         plt.legend()
         
         # Add speedup annotations
-        for i, row in enumerate(hash_data.itertuples()):
-            if hasattr(row, 'avg_hash_speedup'):
-                plt.text(i, min(row.python_avg_hash_time, row.rust_avg_hash_time)/2, 
-                        f"{row.avg_hash_speedup:.1f}x", 
-                        ha='center', va='center', 
-                        color='white', fontweight='bold')
+        labels = [f"{s:.1f}x" if pd.notna(s) else "" for s in hash_data['avg_hash_speedup']]
+        ax.bar_label(rust_rects, labels=labels, label_type='center', color='white', fontweight='bold')
     
     plt.tight_layout()
     plt.savefig(output_file)
@@ -366,17 +507,18 @@ def main():
     parser.add_argument("--plot", "-p", action="store_true", help="Generate plot of results")
     parser.add_argument("--save-images", "-s", action="store_true", help="Save processed images for comparison")
     parser.add_argument("--runs", "-r", type=int, default=3, help="Number of runs for each benchmark")
-    parser.add_argument("--timeout", "-t", type=int, default=60, help="Timeout in seconds for RAW processing")
+    parser.add_argument("--timeout", "-t", type=int, default=60, help="Timeout in seconds per file, counted from when a worker starts "
+                        "benchmarking it; files still running then are reported as timed out")
+    parser.add_argument("--cache", action="store_true", help="Cache decoded RAW images on disk between runs")
+    parser.add_argument("--skip-hash", action="store_true", help="Only benchmark RAW conversion, skip hash timings")
     args = parser.parse_args()
     
     # Find files to benchmark
     if os.path.isdir(args.input):
-        # Find all image files in the directory
-        raw_extensions = [".dng", ".raf", ".arw", ".nef", ".cr2", ".cr3", ".nrw", ".srf"]
-        files = []
-        for ext in raw_extensions:
-            files.extend(glob.glob(os.path.join(args.input, f"*{ext}")))
-            files.extend(glob.glob(os.path.join(args.input, f"*{ext.upper()}")))
+        # Find all RAW files in the directory with a single listing
+        with os.scandir(args.input) as entries:
+            files = [entry.path for entry in entries
+                     if entry.is_file() and is_raw_format(entry.name)]
     else:
         # Single file or glob pattern
         files = glob.glob(args.input)
@@ -396,7 +538,7 @@ def main():
     
     try:
         # Run benchmarks
-        results = benchmark_files(files, output_dir, args.runs, args.timeout)
+        results = benchmark_files(files, output_dir, args.runs, args.timeout, args.cache, args.skip_hash)
         
         # Save results
         results.to_csv(args.output, index=False)
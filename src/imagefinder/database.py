@@ -2,12 +2,128 @@
 
 import os
 import time
+import operator
 import sqlite3
 from pathlib import Path
 from typing import Tuple, List, Optional, Dict, Any
 import logging
+import threading
+from collections import OrderedDict
 from imagefinder.image_types import ImageInfo
 
+# LRU of (path, source_prefix) -> stored modified_at for rows known to exist.
+# Shared by every connection in the process and kept in sync by store_image_infos.
+EXISTS_CACHE_SIZE = 100_000
+_exists_cache: OrderedDict[Tuple[str, str], str] = OrderedDict()
+_exists_cache_lock = threading.Lock()
+
+def clear_exists_cache() -> None:
+    """Forget all cached existence lookups"""
+    with _exists_cache_lock:
+        _exists_cache.clear()
+
+def _remember_exists(key: Tuple[str, str], modified_at: str) -> None:
+    with _exists_cache_lock:
+        _exists_cache[key] = modified_at
+        _exists_cache.move_to_end(key)
+        if len(_exists_cache) > EXISTS_CACHE_SIZE:
+            _exists_cache.popitem(last=False)
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    """
+    Open a connection in autocommit mode
+    
+    Transactions are managed explicitly (BEGIN IMMEDIATE ... COMMIT) by the
+    writers, so SELECTs never open an implicit transaction.
+    """
+    return sqlite3.connect(db_path, isolation_level=None, check_same_thread=False, cached_statements=256)
+
+# Hashes are stored as 64-bit INTEGERs. SQLite integers are signed, so hashes
+# with the top bit set are stored as negative numbers (see _to_db_hash).
+_IMAGES_COLUMNS_SQL = '''
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        path TEXT NOT NULL,
+        source_prefix TEXT NOT NULL,
+        format TEXT NOT NULL,
+        width INTEGER NOT NULL,
+        height INTEGER NOT NULL,
+        created_at TEXT NOT NULL,
+        modified_at TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        average_hash INTEGER NOT NULL,
+        perceptual_hash INTEGER NOT NULL,
+        is_raw_format INTEGER NOT NULL,
+        mtime_ns INTEGER,
+        hash_version INTEGER NOT NULL DEFAULT 1,
+        UNIQUE(path, source_prefix)
+    '''
+
+# Version of the hash algorithms that produced a row, bumped whenever one of
+# them changes. Rows with an older version are treated as not indexed, so the
+# next scan rehashes them. Version 2 switched pHash to the DCT-based algorithm,
+# version 3 hashes JPEGs from a reduced-scale decode, version 4 takes the
+# aHash 8x8 from the 32x32 pHash image, version 5 hashes RAW files from a
+# half-size decode (dcraw -h, rawpy half_size).
+HASH_VERSION = 5
+
+def _to_db_hash(hash_value: int) -> int:
+    """Map an unsigned 64-bit hash onto SQLite's signed INTEGER range"""
+    return hash_value - (1 << 64) if hash_value >= (1 << 63) else hash_value
+
+def _bits_to_db_hash(hash_str: str) -> int:
+    """Convert a legacy 64-char '0'/'1' hash string to its stored INTEGER form"""
+    return _to_db_hash(int(hash_str, 2))
+
+def _migrate_text_hashes(db_conn: sqlite3.Connection) -> None:
+    """
+    Rebuild an images table created with TEXT hash columns
+    
+    Earlier versions stored hashes as 64-char bit strings. Column types cannot
+    be altered in place, so the rows are copied into a table with the current
+    schema, converting the hashes on the way.
+    """
+    column_types = {row[1]: row[2].upper() for row in db_conn.execute('PRAGMA table_info(images)')}
+    if column_types.get('average_hash') != 'TEXT':
+        return
+    
+    db_conn.create_function('bits_to_db_hash', 1, _bits_to_db_hash, deterministic=True)
+    cursor = db_conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        cursor.execute(f'CREATE TABLE images_new ({_IMAGES_COLUMNS_SQL})')
+        cursor.execute('''
+        INSERT INTO images_new (
+            id, path, source_prefix, format, width, height, created_at, modified_at,
+            size, average_hash, perceptual_hash, is_raw_format
+        )
+        SELECT id, path, source_prefix, format, width, height, created_at, modified_at, size,
+               bits_to_db_hash(average_hash), bits_to_db_hash(perceptual_hash), is_raw_format
+        FROM images
+        ''')
+        cursor.execute('DROP TABLE images')
+        cursor.execute('ALTER TABLE images_new RENAME TO images')
+    except BaseException:
+        cursor.execute('ROLLBACK')
+        raise
+    cursor.execute('COMMIT')
+
+def _add_missing_columns(db_conn: sqlite3.Connection) -> None:
+    """Add columns introduced after the images table was first created"""
+    columns = {row[1] for row in db_conn.execute('PRAGMA table_info(images)')}
+    if 'mtime_ns' not in columns:
+        # NULL for rows indexed before the column existed
+        db_conn.execute('ALTER TABLE images ADD COLUMN mtime_ns INTEGER')
+    if 'hash_version' not in columns:
+        # Rows from before the column existed carry the original hashes
+        db_conn.execute('ALTER TABLE images ADD COLUMN hash_version INTEGER NOT NULL DEFAULT 1')
+
+def _upgrade_schema(db_conn: sqlite3.Connection) -> None:
+    """Bring an images table created by an older version up to the current schema"""
+    if db_conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'images'").fetchone() is None:
+        return
+    _migrate_text_hashes(db_conn)
+    _add_missing_columns(db_conn)
+
 def init_database(db_path: str) -> sqlite3.Connection:
     """
     Initialize the database with required tables
@@ -24,41 +140,35 @@ def init_database(db_path: str) -> sqlite3.Connection:
         os.makedirs(db_dir)
     
     # Connect to the database
-    db_conn = sqlite3.connect(db_path)
+    db_conn = _connect(db_path)
+    clear_exists_cache()
     
-    # Create the images table if it doesn't exist
+    # Use write-ahead logging so bulk inserts need one fsync per transaction
     cursor = db_conn.cursor()
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS images (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        path TEXT NOT NULL,
-        source_prefix TEXT NOT NULL,
-        format TEXT NOT NULL,
-        width INTEGER NOT NULL,
-        height INTEGER NOT NULL,
-        created_at TEXT NOT NULL,
-        modified_at TEXT NOT NULL,
-        size INTEGER NOT NULL,
-        average_hash TEXT NOT NULL,
-        perceptual_hash TEXT NOT NULL,
-        is_raw_format INTEGER NOT NULL,
-        UNIQUE(path, source_prefix)
-    )
-    ''')
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA temp_store=MEMORY')
     
-    # Create indexes for faster search
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_path ON images(path)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_source_prefix ON images(source_prefix)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_average_hash ON images(average_hash)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_perceptual_hash ON images(perceptual_hash)')
+    # Create the images table if it doesn't exist
+    cursor.execute(f'CREATE TABLE IF NOT EXISTS images ({_IMAGES_COLUMNS_SQL})')
+    _upgrade_schema(db_conn)
+    
+    # Lookups by (path, source_prefix) are served by the UNIQUE constraint's index.
+    # The search compares hashes by Hamming distance on every row, so no hash
+    # index is ever used; any of these would only slow down inserts.
+    for index_name in ('idx_path', 'idx_source_prefix', 'idx_average_hash', 'idx_perceptual_hash',
+                       'idx_average_hash_prefix', 'idx_perceptual_hash_prefix'):
+        cursor.execute(f'DROP INDEX IF EXISTS {index_name}')
     
-    db_conn.commit()
     return db_conn
 
 def open_database(db_path: str) -> sqlite3.Connection:
     """
     Open an existing database
     
+    A database created by an older version is upgraded in place, as
+    init_database does, so searches can rely on the current schema.
+    
     Args:
         db_path: Path to the database file
     
@@ -72,7 +182,9 @@ def open_database(db_path: str) -> sqlite3.Connection:
         raise FileNotFoundError(f"Database file not found: {db_path}")
     
     try:
-        db_conn = sqlite3.connect(db_path)
+        db_conn = _connect(db_path)
+        _upgrade_schema(db_conn)
+        clear_exists_cache()
         return db_conn
     except Exception as e:
         raise Exception(f"Failed to open database: {str(e)}")
@@ -81,6 +193,8 @@ def check_image_exists(db_conn: sqlite3.Connection, path: str, source_prefix: st
     """
     Check if an image already exists in the database
     
+    Rows hashed with an older HASH_VERSION do not count as existing.
+    
     Args:
         db_conn: Database connection
         path: Path to the image
@@ -91,18 +205,138 @@ def check_image_exists(db_conn: sqlite3.Connection, path: str, source_prefix: st
         - exists is a boolean indicating if the image exists
         - modified_at is the stored modification time as a string
     """
+    key = (path, source_prefix)
+    with _exists_cache_lock:
+        modified_at = _exists_cache.get(key)
+        if modified_at is not None:
+            _exists_cache.move_to_end(key)
+            return True, modified_at
+    
     cursor = db_conn.cursor()
     cursor.execute(
-        "SELECT modified_at FROM images WHERE path = ? AND source_prefix = ?",
-        (path, source_prefix)
+        "SELECT modified_at FROM images WHERE path = ? AND source_prefix = ? AND hash_version = ?",
+        (path, source_prefix, HASH_VERSION)
     )
     
     row = cursor.fetchone()
     if row:
+        _remember_exists(key, row[0])
         return True, row[0]
     
     return False, ""
 
+def get_indexed_file_state(db_conn: sqlite3.Connection, path: str, source_prefix: str) -> Optional[Tuple[int, Optional[int], str]]:
+    """
+    Load the stored file state of one image
+    
+    Args:
+        db_conn: Database connection
+        path: Path to the image
+        source_prefix: Source prefix
+    
+    Returns:
+        (size, mtime_ns, modified_at) as returned by get_indexed_file_states,
+        or None if the image is not indexed with the current HASH_VERSION
+    """
+    cursor = db_conn.execute(
+        "SELECT size, mtime_ns, modified_at FROM images WHERE path = ? AND source_prefix = ? AND hash_version = ?",
+        (path, source_prefix, HASH_VERSION)
+    )
+    return cursor.fetchone()
+
+def get_indexed_file_states(db_conn: sqlite3.Connection, source_prefix: str) -> Dict[str, Tuple[int, Optional[int], str]]:
+    """
+    Load the stored file state of every image under a source prefix
+    
+    Lets a rescan decide which files are unchanged without one query per file.
+    Rows hashed with an older HASH_VERSION are left out, so they get rehashed.
+    
+    Args:
+        db_conn: Database connection
+        source_prefix: Source prefix
+    
+    Returns:
+        Dict mapping path to (size, mtime_ns, modified_at); mtime_ns is None
+        for rows indexed before it was recorded
+    """
+    cursor = db_conn.execute(
+        "SELECT path, size, mtime_ns, modified_at FROM images WHERE source_prefix = ? AND hash_version = ?",
+        (source_prefix, HASH_VERSION)
+    )
+    return {path: (size, mtime_ns, modified_at) for path, size, mtime_ns, modified_at in cursor}
+
+def store_file_mtimes(db_conn: sqlite3.Connection, source_prefix: str, mtimes: List[Tuple[str, int]]) -> None:
+    """
+    Record mtime_ns for rows indexed before it was stored
+    
+    A rescan that finds such a file unchanged backfills its mtime_ns, so later
+    rescans compare integers instead of re-parsing modified_at.
+    
+    Args:
+        db_conn: Database connection
+        source_prefix: Source prefix
+        mtimes: (path, mtime_ns) pairs
+    """
+    if not mtimes:
+        return
+    
+    if db_conn.in_transaction:
+        db_conn.commit()
+    
+    cursor = db_conn.cursor()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        cursor.executemany(
+            "UPDATE images SET mtime_ns = ? WHERE path = ? AND source_prefix = ? AND mtime_ns IS NULL",
+            [(mtime_ns, path, source_prefix) for path, mtime_ns in mtimes]
+        )
+    except BaseException:
+        cursor.execute('ROLLBACK')
+        raise
+    cursor.execute('COMMIT')
+
+_INSERT_SQL = '''
+INSERT INTO images (
+    path, source_prefix, format, width, height, created_at, modified_at,
+    size, average_hash, perceptual_hash, is_raw_format, mtime_ns, hash_version
+) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+_UPDATE_SET_SQL = '''ON CONFLICT(path, source_prefix) DO UPDATE SET
+    format = excluded.format,
+    width = excluded.width,
+    height = excluded.height,
+    modified_at = excluded.modified_at,
+    size = excluded.size,
+    average_hash = excluded.average_hash,
+    perceptual_hash = excluded.perceptual_hash,
+    is_raw_format = excluded.is_raw_format,
+    mtime_ns = excluded.mtime_ns,
+    hash_version = excluded.hash_version
+'''
+
+# Existing rows are left untouched unless a rewrite is forced, their hashes
+# come from an older HASH_VERSION or the file's size or mtime has changed
+_INSERT_OR_KEEP_SQL = _INSERT_SQL + _UPDATE_SET_SQL + '''WHERE images.hash_version < excluded.hash_version
+    OR images.size IS NOT excluded.size
+    OR images.mtime_ns IS NOT excluded.mtime_ns'''
+
+_UPSERT_SQL = _INSERT_SQL + _UPDATE_SET_SQL
+
+# Maximum number of rows written per transaction by store_image_infos
+STORE_BATCH_SIZE = 1000
+
+# Fetch the stored ImageInfo fields with one C call per row
+_INSERT_COLS = operator.attrgetter('path', 'source_prefix', 'format', 'width', 'height',
+                                   'modified_at', 'size', 'average_hash', 'perceptual_hash',
+                                   'is_raw_format', 'mtime_ns')
+
+def _image_info_row(image_info: ImageInfo, current_time: str) -> tuple:
+    """Build the INSERT parameter tuple for an image"""
+    fields = _INSERT_COLS(image_info)
+    return (*fields[:5], current_time, *fields[5:7],
+            _to_db_hash(fields[7]), _to_db_hash(fields[8]), int(fields[9]), fields[10], HASH_VERSION)
+
 def store_image_info(db_conn: sqlite3.Connection, image_info: ImageInfo, force_rewrite: bool) -> None:
     """
     Store image information in the database
@@ -112,63 +346,50 @@ def store_image_info(db_conn: sqlite3.Connection, image_info: ImageInfo, force_r
         image_info: Image information to store
         force_rewrite: Whether to force rewrite existing entries
     """
-    cursor = db_conn.cursor()
+    store_image_infos(db_conn, [image_info], force_rewrite)
+
+def store_image_infos(db_conn: sqlite3.Connection, infos: List[ImageInfo], force_rewrite: bool) -> None:
+    """
+    Store a batch of image information in the database
     
-    # Check if exists
-    exists, _ = check_image_exists(db_conn, image_info.path, image_info.source_prefix)
+    Rows are written with executemany, one BEGIN IMMEDIATE transaction per
+    STORE_BATCH_SIZE rows. A transaction already open on the connection is
+    committed first.
     
+    Args:
+        db_conn: Database connection
+        infos: Image information to store
+        force_rewrite: Whether to force rewrite existing entries
+    """
+    sql = _UPSERT_SQL if force_rewrite else _INSERT_OR_KEEP_SQL
     current_time = time.strftime("%Y-%m-%dT%H:%M:%S%z")
     
-    if exists and force_rewrite:
-        # Update existing record
-        cursor.execute('''
-        UPDATE images SET 
-            format = ?,
-            width = ?,
-            height = ?,
-            modified_at = ?,
-            size = ?,
-            average_hash = ?,
-            perceptual_hash = ?,
-            is_raw_format = ?
-        WHERE path = ? AND source_prefix = ?
-        ''', (
-            image_info.format,
-            image_info.width,
-            image_info.height,
-            image_info.modified_at,
-            image_info.size,
-            image_info.average_hash,
-            image_info.perceptual_hash,
-            1 if image_info.is_raw_format else 0,
-            image_info.path,
-            image_info.source_prefix
-        ))
-    elif not exists:
-        # Insert new record
-        cursor.execute('''
-        INSERT INTO images (
-            path, source_prefix, format, width, height, created_at, modified_at,
-            size, average_hash, perceptual_hash, is_raw_format
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            image_info.path,
-            image_info.source_prefix,
-            image_info.format,
-            image_info.width,
-            image_info.height,
-            current_time,
-            image_info.modified_at,
-            image_info.size,
-            image_info.average_hash,
-            image_info.perceptual_hash,
-            1 if image_info.is_raw_format else 0
-        ))
-    
-    db_conn.commit()
+    if db_conn.in_transaction:
+        db_conn.commit()
+    
+    cursor = db_conn.cursor()
+    for start in range(0, len(infos), STORE_BATCH_SIZE):
+        batch = infos[start:start + STORE_BATCH_SIZE]
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            cursor.executemany(sql, [_image_info_row(info, current_time) for info in batch])
+        except BaseException:
+            cursor.execute('ROLLBACK')
+            raise
+        cursor.execute('COMMIT')
+        
+        for info in batch:
+            key = (info.path, info.source_prefix)
+            if force_rewrite:
+                _remember_exists(key, info.modified_at)
+            else:
+                # An existing row may have been kept, so let the next lookup re-read it
+                with _exists_cache_lock:
+                    _exists_cache.pop(key, None)
 
 # Aliases for better compatibility with original Go code
 InitDatabase = init_database
 OpenDatabase = open_database
 CheckImageExists = check_image_exists
-StoreImageInfo = store_image_info
\ No newline at end of file
+StoreImageInfo = store_image_info
+StoreImageInfos = store_image_infos
\ No newline at end of file
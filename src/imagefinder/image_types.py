@@ -1,9 +1,10 @@
 #!/usr/bin/env python3
 
+import operator
 from dataclasses import dataclass
 from typing import Optional
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class ImageInfo:
     """Holds the image metadata and features"""
     id: int
@@ -15,47 +16,44 @@ class ImageInfo:
     created_at: str
     modified_at: str
     size: int
-    average_hash: str
-    perceptual_hash: str
+    average_hash: int
+    perceptual_hash: int
     is_raw_format: bool
+    mtime_ns: Optional[int] = None
     
     def to_dict(self):
         """Convert to dictionary for JSON serialization"""
-        return {
-            "id": self.id,
-            "path": self.path,
-            "source_prefix": self.source_prefix,
-            "format": self.format,
-            "width": self.width,
-            "height": self.height,
-            "created_at": self.created_at,
-            "modified_at": self.modified_at,
-            "size": self.size,
-            "average_hash": self.average_hash,
-            "perceptual_hash": self.perceptual_hash,
-            "is_raw_format": self.is_raw_format
-        }
+        return dict(zip(_IMAGE_INFO_KEYS, _get_image_info_fields(self)))
     
     @classmethod
     def from_dict(cls, data):
         """Create instance from dictionary"""
-        return cls(
-            id=data.get("id", 0),
-            path=data.get("path", ""),
-            source_prefix=data.get("source_prefix", ""),
-            format=data.get("format", ""),
-            width=data.get("width", 0),
-            height=data.get("height", 0),
-            created_at=data.get("created_at", ""),
-            modified_at=data.get("modified_at", ""),
-            size=data.get("size", 0),
-            average_hash=data.get("average_hash", ""),
-            perceptual_hash=data.get("perceptual_hash", ""),
-            is_raw_format=data.get("is_raw_format", False)
-        )
+        return cls(**{key: data.get(key, default) for key, default in _IMAGE_INFO_DEFAULTS.items()})
 
 
-@dataclass
+# Field names in declaration order, fetched in one attrgetter call by to_dict
+_IMAGE_INFO_KEYS = tuple(ImageInfo.__dataclass_fields__)
+_get_image_info_fields = operator.attrgetter(*_IMAGE_INFO_KEYS)
+
+# Values used by from_dict for missing keys
+_IMAGE_INFO_DEFAULTS = {
+    "id": 0,
+    "path": "",
+    "source_prefix": "",
+    "format": "",
+    "width": 0,
+    "height": 0,
+    "created_at": "",
+    "modified_at": "",
+    "size": 0,
+    "average_hash": 0,
+    "perceptual_hash": 0,
+    "is_raw_format": False,
+    "mtime_ns": None,
+}
+
+
+@dataclass(slots=True, frozen=True)
 class ImageMatch:
     """Holds the similarity scores"""
     path: str
@@ -1,25 +1,34 @@
 #!/usr/bin/env python3
 
 import os
+import re
 import sys
 import time
 import subprocess
 import tempfile
+from imagefinder.database import _to_db_hash, HASH_VERSION
 from imagefinder.image_types import ImageInfo, ImageMatch
+from imagefinder.raw_backends import read_grayscale, RAW_EXTENSIONS
 import abc
-from pathlib import Path
 from typing import List, Tuple, Dict, Optional, Any
 import numpy as np
 import cv2
 import sqlite3
 from dataclasses import dataclass
 from concurrent.futures import ThreadPoolExecutor
-from threading import Lock
+from functools import lru_cache
 
 import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Batched SSIM on the GPU when torch and a CUDA device are available
+try:
+    from imagefinder._ssim_torch import batched_ssim
+    TORCH_SSIM_ENABLED = True
+except ImportError:
+    TORCH_SSIM_ENABLED = False
+
 
 @dataclass
 class SearchOptions:
@@ -30,7 +39,7 @@ class SearchOptions:
     debug_mode: bool
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class ImageMatch:
     """Represents a matching image with its score"""
     path: str
@@ -41,6 +50,10 @@ class ImageMatch:
 class ImageLoader(abc.ABC):
     """Interface for loading different image formats"""
     
+    # Lower-case extensions (with the dot) the loader handles. Loaders that
+    # decide by other means leave it empty.
+    extensions: frozenset = frozenset()
+    
     @abc.abstractmethod
     def can_load(self, path: str) -> bool:
         """Check if this loader can load the given file"""
@@ -52,19 +65,34 @@ class ImageLoader(abc.ABC):
         pass
 
 
+def _decode_bytes(buf: bytes) -> Optional[np.ndarray]:
+    """Decode an encoded image held in memory to grayscale, None if it is empty or unreadable"""
+    if not buf:
+        return None
+    img = cv2.imdecode(np.frombuffer(buf, np.uint8), cv2.IMREAD_GRAYSCALE)
+    if img is None or img.size == 0:
+        return None
+    return img
+
+
 class DefaultImageLoader(ImageLoader):
     """Handles common formats supported by OpenCV directly"""
     
+    extensions = frozenset({'.jpg', '.jpeg', '.png', '.tiff', '.tif'})
+    
     def can_load(self, path: str) -> bool:
-        ext = Path(path).suffix.lower()
+        ext = os.path.splitext(path)[1].lower()
         # Check extension and make sure file exists and is readable
-        if ext in ['.jpg', '.jpeg', '.png', '.tiff', '.tif']:
+        if ext in self.extensions:
             return os.path.isfile(path)
         return False
     
     def load_image(self, path: str) -> np.ndarray:
-        img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
-        if img is None or img.size == 0:
+        # Read the bytes in one call and decode them in memory, rather than
+        # letting OpenCV open and stat the file again
+        with open(path, 'rb') as f:
+            img = _decode_bytes(f.read())
+        if img is None:
             raise ValueError(f"Failed to load image with default loader: {path}")
         return img
 
@@ -72,76 +100,63 @@ class DefaultImageLoader(ImageLoader):
 class RawImageLoader(ImageLoader):
     """Handles RAW camera formats"""
     
+    # DNG, RAF, ARW, NEF, CR2, CR3, NRW and SRF
+    extensions = RAW_EXTENSIONS
+    
     def __init__(self):
         # Create a temp directory for raw image processing if needed
         self.temp_dir = tempfile.gettempdir()
     
     def can_load(self, path: str) -> bool:
-        ext = Path(path).suffix.lower()
-        # Explicitly include all requested formats: DNG, RAF, ARW, NEF, CR2, CR3
-        raw_formats = ['.dng', '.raf', '.arw', '.nef', '.cr2', '.cr3', '.nrw', '.srf']
-        if ext in raw_formats:
+        ext = os.path.splitext(path)[1].lower()
+        if ext in self.extensions:
             return os.path.isfile(path)
         return False
     
     def load_image(self, path: str) -> np.ndarray:
-        # Create a unique temporary filename for the converted image
-        temp_filename = os.path.join(self.temp_dir, f"raw_conv_{int(time.time()*1000000)}.tiff")
-        
-        try:
-            # Check if it's a CR3 file specifically
-            if Path(path).suffix.lower() == '.cr3':
-                success, img = self.try_cr3(path, temp_filename)
-                if success:
-                    return img
-            
-            # First try with dcraw
-            success, img = self.try_dcraw(path, temp_filename)
-            if success:
-                return img
-            
-            # If dcraw fails, try rawpy fallback
-            success, img = self.try_rawpy(path, temp_filename)
+        # CR3 files try their embedded preview first. Then rawpy, which
+        # decodes in process (no fork/exec, no temp file), then dcraw.
+        if path.lower().endswith('.cr3'):
+            success, img = self.try_cr3(path)
             if success:
                 return img
-            
-            # If all else fails, attempt direct load (unlikely to work for most RAW formats)
-            img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
-            if img is not None and img.size > 0:
-                return img
-            
-            raise ValueError(f"Failed to load RAW image: {path} (all conversion methods failed)")
         
-        finally:
-            # Clean up the temporary file
-            if os.path.exists(temp_filename):
-                try:
-                    os.remove(temp_filename)
-                except:
-                    pass
+        success, img = self.try_rawpy(path)
+        if success:
+            return img
+        
+        # If rawpy fails, try dcraw fallback
+        success, img = self.try_dcraw(path)
+        if success:
+            return img
+        
+        # If all else fails, attempt direct load (unlikely to work for most RAW formats)
+        img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if img is not None and img.size > 0:
+            return img
+        
+        raise ValueError(f"Failed to load RAW image: {path} (all conversion methods failed)")
     
-    def try_dcraw(self, path: str, temp_filename: str) -> Tuple[bool, np.ndarray]:
+    def try_dcraw(self, path: str) -> Tuple[bool, np.ndarray]:
         # Convert RAW to TIFF using dcraw
         # -T = output TIFF
-        # -c = output to stdout (we redirect to file)
+        # -c = output to stdout (decoded straight from the pipe)
         # -w = use camera white balance
-        # -q 3 = use high-quality interpolation
+        # -h = half-size, skipping interpolation (only compared at SSIM_SIZE)
         try:
-            with open(temp_filename, 'wb') as out_file:
-                process = subprocess.Popen(
-                    ['dcraw', '-T', '-c', '-w', '-q', '3', path],
-                    stdout=out_file,
-                    stderr=subprocess.PIPE
-                )
-                _, stderr = process.communicate()
-                
-                if process.returncode != 0:
-                    logger.warning(f"dcraw conversion failed: {stderr.decode()}")
-                    return False, None
+            process = subprocess.run(
+                ['dcraw', '-T', '-c', '-w', '-h', path],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE
+            )
             
-            # Load the converted TIFF
-            img = cv2.imread(temp_filename, cv2.IMREAD_GRAYSCALE)
-            if img is None or img.size == 0:
+            if process.returncode != 0:
+                logger.warning(f"dcraw conversion failed: {process.stderr.decode()}")
+                return False, None
+            
+            # Decode the converted TIFF
+            img = _decode_bytes(process.stdout)
+            if img is None:
                 return False, None
             
             return True, img
@@ -150,58 +165,58 @@ class RawImageLoader(ImageLoader):
             logger.warning(f"Error during dcraw conversion: {e}")
             return False, None
     
-    def try_rawpy(self, path: str, temp_filename: str) -> Tuple[bool, np.ndarray]:
-        # Try with rawpy as an alternative for RAW conversion
+    def try_rawpy(self, path: str) -> Tuple[bool, np.ndarray]:
+        # Decode with LibRaw through rawpy, keeping the pixels in memory
         try:
             import rawpy
-            import imageio
             
             with rawpy.imread(path) as raw:
-                # Process with camera white balance and default settings
-                rgb = raw.postprocess(use_camera_wb=True, no_auto_bright=False, output_bps=8)
-                
-                # Save to temporary file
-                imageio.imsave(temp_filename, rgb)
-                
-                # Convert to grayscale and return
-                img = cv2.imread(temp_filename, cv2.IMREAD_GRAYSCALE)
-                if img is None or img.size == 0:
-                    return False, None
-                
-                return True, img
+                # Process with camera white balance at half size (demosaicing
+                # skipped); the loaded image is only compared at SSIM_SIZE
+                rgb = raw.postprocess(use_camera_wb=True, no_auto_bright=False, output_bps=8, half_size=True)
+            
+            # Convert to grayscale and return
+            img = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
+            if img is None or img.size == 0:
+                return False, None
+            
+            return True, img
                 
         except Exception as e:
             logger.warning(f"Error during rawpy conversion: {e}")
             return False, None
     
-    def try_cr3(self, path: str, temp_filename: str) -> Tuple[bool, np.ndarray]:
+    def try_cr3(self, path: str) -> Tuple[bool, np.ndarray]:
         # Try with exiftool to extract preview image (often works for CR3)
         try:
-            with open(temp_filename, 'wb') as out_file:
-                process = subprocess.Popen(
-                    ['exiftool', '-b', '-PreviewImage', path],
-                    stdout=out_file,
-                    stderr=subprocess.PIPE
-                )
-                _, stderr = process.communicate()
-            
-            # Check if file has content
-            if os.path.getsize(temp_filename) > 0:
-                img = cv2.imread(temp_filename, cv2.IMREAD_GRAYSCALE)
-                if img is not None and img.size > 0:
-                    return True, img
-            
-            # Alternative approach using newer versions of libraw
-            process = subprocess.Popen(
-                ['libraw_unpack', '-O', temp_filename, path],
+            process = subprocess.run(
+                ['exiftool', '-b', '-PreviewImage', path],
+                stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE
             )
-            _, stderr = process.communicate()
             
-            if process.returncode == 0:
-                img = cv2.imread(temp_filename, cv2.IMREAD_GRAYSCALE)
-                if img is not None and img.size > 0:
-                    return True, img
+            img = _decode_bytes(process.stdout)
+            if img is not None:
+                return True, img
+            
+            # Alternative approach using newer versions of libraw, which can
+            # only write to a file
+            temp_filename = os.path.join(self.temp_dir, f"raw_conv_{int(time.time()*1000000)}.tiff")
+            try:
+                process = subprocess.run(
+                    ['libraw_unpack', '-O', temp_filename, path],
+                    stderr=subprocess.PIPE
+                )
+                
+                if process.returncode == 0:
+                    img = cv2.imread(temp_filename, cv2.IMREAD_GRAYSCALE)
+                    if img is not None and img.size > 0:
+                        return True, img
+            finally:
+                try:
+                    os.remove(temp_filename)
+                except OSError:
+                    pass
             
             return False, None
         
@@ -212,9 +227,11 @@ class RawImageLoader(ImageLoader):
 class HeicImageLoader(ImageLoader):
     """Handles HEIC/HEIF formats"""
     
+    extensions = frozenset({'.heic', '.heif'})
+    
     def can_load(self, path: str) -> bool:
-        ext = Path(path).suffix.lower()
-        if ext in ['.heic', '.heif']:
+        ext = os.path.splitext(path)[1].lower()
+        if ext in self.extensions:
             return os.path.isfile(path)
         return False
     
@@ -259,10 +276,26 @@ class ImageLoaderRegistry:
             RawImageLoader(),
             HeicImageLoader()
         ]
+        self._update_supported_extensions()
+    
+    def _update_supported_extensions(self) -> None:
+        # Union of the loaders' extensions and the first loader for each, or
+        # None when a loader does not declare any (then every file has to be
+        # offered to the loaders)
+        if all(loader.extensions for loader in self.loaders):
+            self.supported_extensions = frozenset().union(*(loader.extensions for loader in self.loaders))
+            self._loaders_by_extension = {}
+            for loader in self.loaders:
+                for ext in loader.extensions:
+                    self._loaders_by_extension.setdefault(ext, loader)
+        else:
+            self.supported_extensions = None
+            self._loaders_by_extension = None
     
     def register_loader(self, loader: ImageLoader) -> None:
         """Add a custom loader to the registry"""
         self.loaders.append(loader)
+        self._update_supported_extensions()
     
     def get_loaders(self) -> List[ImageLoader]:
         """Returns the list of registered loaders"""
@@ -271,96 +304,161 @@ class ImageLoaderRegistry:
     # Changed to lowercase method name to match the method definitions
     def can_load_file(self, path: str) -> bool:
         """Check if any registered loader can handle the given file"""
+        # Reject unsupported extensions without asking each loader (and
+        # without touching the filesystem)
+        if self.supported_extensions is not None and os.path.splitext(path)[1].lower() not in self.supported_extensions:
+            return False
         return any(loader.can_load(path) for loader in self.loaders)
 
-    def load_image(self, path: str) -> np.ndarray:
-        """Try to load an image using the appropriate loader"""
+    def get_loader(self, path: str) -> Optional[ImageLoader]:
+        """
+        Return the loader for a file, or None if no loader handles it
+        
+        Dispatch is a lookup on the extension; whether the file exists is left
+        to the loader, which fails on it when loading.
+        """
+        if self._loaders_by_extension is not None:
+            return self._loaders_by_extension.get(os.path.splitext(path)[1].lower())
         for loader in self.loaders:
             if loader.can_load(path):
-                return loader.load_image(path)  # Changed from LoadImage to load_image
-        
-        raise ValueError(f"No suitable loader found for image: {path}")
+                return loader
+        return None
+
+    def load_image(self, path: str) -> np.ndarray:
+        """Try to load an image using the appropriate loader"""
+        loader = self.get_loader(path)
+        if loader is None:
+            raise ValueError(f"No suitable loader found for image: {path}")
+        return loader.load_image(path)
+
+# Shared by load_image and the search, which only read from it
+_registry = ImageLoaderRegistry()
+
+# Formats whose decoder can downscale while decoding (libjpeg DCT scaling)
+SCALED_DECODE_EXTENSIONS = ('.jpg', '.jpeg')
+
+def load_image(path: str, for_hashing: bool = False) -> np.ndarray:
+    """
+    Load an image in grayscale with error handling
+    
+    The hashes only look at a 32x32 version of the image, so with for_hashing
+    JPEGs are decoded at reduced scale (see raw_backends.read_grayscale).
+    Images loaded this way are not suitable for SSIM.
+    """
+    if for_hashing and os.path.splitext(path)[1].lower() in SCALED_DECODE_EXTENSIONS:
+        img = read_grayscale(path)
+        if img is not None:
+            return img
+    return _registry.load_image(path)
+
+
+def _fast_box_down(img: np.ndarray, target: int) -> np.ndarray:
+    """
+    Downsample an image to target x target by averaging equal integer blocks
+    
+    The image is cropped to a multiple of target and each block is summed in
+    one pass, which matches INTER_AREA for integer ratios. Images with a side
+    below target * target (where the crop would drop a visible share of the
+    image), or that are not 8-bit, go through cv2.resize. An image that is
+    already target x target is returned as is.
+    """
+    if img.shape[:2] == (target, target):
+        return img
+    
+    min_side = target * target
+    if img.dtype != np.uint8 or img.shape[0] < min_side or img.shape[1] < min_side:
+        return cv2.resize(img, (target, target), interpolation=cv2.INTER_AREA)
+    
+    block_h = img.shape[0] // target
+    block_w = img.shape[1] // target
+    cropped = img[:block_h * target, :block_w * target]
+    sums = cropped.reshape(target, block_h, target, block_w, *img.shape[2:]).sum(axis=(1, 3), dtype=np.uint64)
+    area = block_h * block_w
+    return ((sums + area // 2) // area).astype(np.uint8)
 
-def load_image(path: str) -> np.ndarray:
-    """Load an image in grayscale with error handling"""
-    registry = ImageLoaderRegistry()
-    return registry.load_image(path)
 
+def _pack_hash_bits(bits: np.ndarray) -> int:
+    """Pack 64 hash bits (row-major, first bit most significant) into an unsigned integer"""
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), 'big')
 
-def compute_average_hash(img: np.ndarray) -> str:
-    """Compute average hash for image indexing"""
-    # Resize to 8x8
-    resized = cv2.resize(img, (8, 8), interpolation=cv2.INTER_AREA)
+
+def _average_hash_grid(gray32: np.ndarray) -> np.ndarray:
+    """
+    The 8x8 image the average hash is computed on
     
-    # Convert to grayscale if not already
-    if len(resized.shape) > 2:
-        gray = cv2.cvtColor(resized, cv2.COLOR_BGR2GRAY)
-    else:
-        gray = resized
+    Derived from the 32x32 pHash image (rounded 4x4 block means) rather than
+    from the full image, so both hashes share a single pass over the pixels.
+    """
+    sums = gray32.reshape(8, 4, 8, 4).sum(axis=(1, 3), dtype=np.uint32)
+    return ((sums + 8) // 16).astype(np.uint8)
+
+
+# The DCT coefficients are rounded to this many decimals before thresholding,
+# so implementations that sum in a different order (cv2.dct, the Numba and
+# Rust kernels) agree on ties such as the all-zero AC terms of a flat image
+PHASH_DCT_DECIMALS = 6
+
+def _dct_low_frequencies(gray: np.ndarray) -> np.ndarray:
+    """The 8x8 lowest-frequency coefficients of the DCT of a 32x32 grayscale image"""
+    coeffs = cv2.dct(gray.astype(np.float64))[:8, :8]
+    return np.round(coeffs, PHASH_DCT_DECIMALS)
+
+
+def compute_average_hash(img: np.ndarray) -> int:
+    """Compute the 64-bit average hash for image indexing"""
+    # Every loader decodes to 8-bit grayscale
+    assert img.ndim == 2 and img.dtype == np.uint8, "expected a 2D uint8 grayscale image"
+    
+    # Resize to 8x8 by way of the 32x32 pHash image
+    gray = _average_hash_grid(_fast_box_down(img, 32))
     
     # Calculate average pixel value
     avg_pixel_value = gray.mean()
     
-    # Compute the hash
-    hash_str = ""
-    for i in range(8):
-        for j in range(8):
-            if gray[i, j] >= avg_pixel_value:
-                hash_str += "1"
-            else:
-                hash_str += "0"
-    
-    return hash_str
+    # One bit per pixel, set where the pixel is at least the mean
+    return _pack_hash_bits(gray >= avg_pixel_value)
 
 
-def compute_perceptual_hash(img: np.ndarray) -> str:
-    """Compute perceptual hash (pHash) for better matching"""
+def compute_perceptual_hash(img: np.ndarray) -> int:
+    """Compute the 64-bit perceptual hash (pHash) for better matching"""
+    # Every loader decodes to 8-bit grayscale
+    assert img.ndim == 2 and img.dtype == np.uint8, "expected a 2D uint8 grayscale image"
+    
     # Resize to 32x32
-    resized = cv2.resize(img, (32, 32), interpolation=cv2.INTER_AREA)
+    gray = _fast_box_down(img, 32)
     
-    # Convert to grayscale if not already
-    if len(resized.shape) > 2:
-        gray = cv2.cvtColor(resized, cv2.COLOR_BGR2GRAY)
-    else:
-        gray = resized
-    
-    # Create a simplified hash based on brightness patterns
-    regions = 8  # 8x8 regions
-    region_values = []
-    
-    # Calculate average brightness in each region
-    region_height = gray.shape[0] // regions
-    region_width = gray.shape[1] // regions
-    
-    for i in range(regions):
-        for j in range(regions):
-            # Calculate region boundaries
-            start_y = i * region_height
-            end_y = (i + 1) * region_height
-            start_x = j * region_width
-            end_x = (j + 1) * region_width
-            
-            # Calculate average for region
-            region = gray[start_y:end_y, start_x:end_x]
-            avg = np.mean(region)
-            region_values.append(avg)
-    
-    # Calculate median
-    median = np.median(region_values)
-    
-    # Create hash based on whether each value is above median
-    hash_str = ""
-    for val in region_values:
-        if val > median:
-            hash_str += "1"
-        else:
-            hash_str += "0"
+    # Keep the lowest 8x8 frequencies of the DCT
+    low_freqs = _dct_low_frequencies(gray).ravel()
     
-    return hash_str
+    # Threshold against the median of the AC terms (the DC term only carries
+    # the overall brightness)
+    median = np.median(low_freqs[1:])
+    
+    # Create hash based on whether each coefficient is above the median
+    return _pack_hash_bits(low_freqs > median)
+
 
+def compute_hashes(img: np.ndarray) -> Tuple[int, int]:
+    """Compute the average and perceptual hash from a single 32x32 downsample of the image"""
+    gray = _fast_box_down(img, 32)
+    return compute_average_hash(gray), compute_perceptual_hash(gray)
+
+
+# Standard SSIM parameters (Wang et al. 2004): an 11x11 Gaussian window with
+# sigma 1.5 and the stabilizing constants for an 8-bit dynamic range
+SSIM_WINDOW = (11, 11)
+SSIM_SIGMA = 1.5
+SSIM_C1 = (0.01 * 255) ** 2
+SSIM_C2 = (0.03 * 255) ** 2
 
 def compute_ssim(img1: np.ndarray, img2: np.ndarray) -> float:
-    """Compute a simplified and more robust SSIM implementation"""
+    """
+    Compute the structural similarity (SSIM) of two grayscale images
+    
+    Both images must have the same shape; the search resizes them to SSIM_SIZE
+    up front. The local means, variances and covariance are Gaussian-filtered
+    with OpenCV, and the score is the mean of the SSIM map (1 = identical).
+    """
     # Check for valid matrices
     if img1 is None or img2 is None or img1.size == 0 or img2.size == 0:
         return 0.0
@@ -376,53 +474,61 @@ def compute_ssim(img1: np.ndarray, img2: np.ndarray) -> float:
     else:
         img2_gray = img2
     
-    # Ensure images are same size
-    resized = cv2.resize(img2_gray, (img1_gray.shape[1], img1_gray.shape[0]), interpolation=cv2.INTER_LINEAR)
+    assert img1_gray.shape == img2_gray.shape, "expected images of the same size"
     
-    # Calculate simple mean difference
-    diff = cv2.absdiff(img1_gray, resized)
+    i1 = img1_gray.astype(np.float32)
+    i2 = img2_gray.astype(np.float32)
     
-    if diff.size == 0:
-        return 0.0
+    mu1 = cv2.GaussianBlur(i1, SSIM_WINDOW, SSIM_SIGMA)
+    mu2 = cv2.GaussianBlur(i2, SSIM_WINDOW, SSIM_SIGMA)
+    mu1_sq = mu1 * mu1
+    mu2_sq = mu2 * mu2
+    mu1_mu2 = mu1 * mu2
     
-    mean_diff = np.mean(diff)
+    sigma1_sq = cv2.GaussianBlur(i1 * i1, SSIM_WINDOW, SSIM_SIGMA) - mu1_sq
+    sigma2_sq = cv2.GaussianBlur(i2 * i2, SSIM_WINDOW, SSIM_SIGMA) - mu2_sq
+    sigma12 = cv2.GaussianBlur(i1 * i2, SSIM_WINDOW, SSIM_SIGMA) - mu1_mu2
     
-    if mean_diff > 255.0:
-        return 0.0
+    ssim_map = ((2 * mu1_mu2 + SSIM_C1) * (2 * sigma12 + SSIM_C2)) / \
+               ((mu1_sq + mu2_sq + SSIM_C1) * (sigma1_sq + sigma2_sq + SSIM_C2))
     
-    # Return similarity score (1 = identical, 0 = completely different)
-    return 1.0 - (mean_diff / 255.0)
+    return float(ssim_map.mean())
 
 
-def calculate_hamming_distance(hash1: str, hash2: str) -> int:
-    """Calculate the number of differing bits between two hash strings"""
-    distance = 0
-    min_len = min(len(hash1), len(hash2))
-    
-    for i in range(min_len):
-        if hash1[i] != hash2[i]:
-            distance += 1
+HASH_MASK = 0xFFFFFFFFFFFFFFFF
+
+def calculate_hamming_distance(hash1: int, hash2: int) -> int:
+    """
+    Calculate the number of differing bits between two 64-bit hashes
     
-    return distance
+    Hashes read back from SQLite are signed; masking the XOR makes signed and
+    unsigned forms of the same bits compare equal.
+    """
+    return ((hash1 ^ hash2) & HASH_MASK).bit_count()
 
 
+JPG_EXTENSIONS = frozenset({'.jpg', '.jpeg'})
+
 def is_jpg_format(path: str) -> bool:
     """Check if a file is in JPG format"""
-    ext = Path(path).suffix.lower()
-    return ext in ['.jpg', '.jpeg']
+    return os.path.splitext(path)[1].lower() in JPG_EXTENSIONS
 
 
 def get_base_filename(path: str) -> str:
     """Extract the base filename without extension and path"""
     # Get just the filename without the directory
-    filename = os.path.basename(path)
-    # Remove the extension
-    return os.path.splitext(filename)[0]
+    filename = path.rpartition(os.sep)[2]
+    # Remove the extension; a name without one (or a dotfile) is kept whole,
+    # as os.path.splitext does
+    stem = filename.rpartition('.')[0]
+    return stem if stem else filename
+
 
+_NONDIGITS = re.compile(r'\D+')
 
 def extract_digits(s: str) -> str:
     """Extract just the digits from a string"""
-    return ''.join(ch for ch in s if ch.isdigit())
+    return _NONDIGITS.sub('', s)
 
 
 def are_filenames_related(path1: str, path2: str) -> bool:
@@ -439,22 +545,69 @@ def are_filenames_related(path1: str, path2: str) -> bool:
     if base1.startswith(base2) or base2.startswith(base1):
         return True
     
-    # 2. Check for the same numeric part (cameras often use numeric names)
+    # 2. Check for the same numeric part (cameras often use numeric names);
+    # a name without digits cannot match, so the second is only scanned if
+    # the first has some
     digits1 = extract_digits(base1)
-    digits2 = extract_digits(base2)
-    
-    if digits1 and digits2 and digits1 == digits2:
-        return True
+    if not digits1:
+        return False
     
-    return False
+    return extract_digits(base2) == digits1
 
 
 def is_raw_format(path: str) -> bool:
     """Check if a file is in RAW format"""
-    ext = Path(path).suffix.lower()
-    raw_formats = ['.dng', '.raf', '.arw', '.nef', '.cr2', '.cr3', '.nrw', '.srf']
-    return ext in raw_formats
-
+    return os.path.splitext(path)[1].lower() in RAW_EXTENSIONS
+
+
+# Candidate checks mix file I/O and decoding with SSIM, and OpenCV releases
+# the GIL for both, so the pool scales with the machine and is oversubscribed
+# to overlap the I/O
+SEARCH_WORKERS = min(32, (os.cpu_count() or 4) * 2)
+
+# Side of the square that both images are resized to for SSIM, and how many of
+# these (64KB) candidate images are kept across searches
+SSIM_SIZE = 256
+SSIM_CACHE_SIZE = 2048
+
+# GPU SSIM only pays for its transfers on larger candidate sets; batches are
+# capped so the float32 intermediates (about 2MB per candidate) fit the device
+SSIM_GPU_MIN_BATCH = 16
+SSIM_GPU_BATCH = 256
+
+def _to_ssim_size(img: np.ndarray) -> np.ndarray:
+    return cv2.resize(img, (SSIM_SIZE, SSIM_SIZE), interpolation=cv2.INTER_AREA)
+
+@lru_cache(maxsize=SSIM_CACHE_SIZE)
+def _load_ssim_image(path: str, stamp: Any, size: int) -> np.ndarray:
+    """
+    Load a candidate image at SSIM size, cached across searches
+    
+    stamp (the indexed mtime_ns, or modified_at for rows that predate it) and
+    size come from the database and only key the cache, so a file that was
+    rescanned after changing is decoded again. Repeated searches skip the
+    decode, RAW conversions in particular. The returned array is shared and
+    read-only.
+    """
+    img = _to_ssim_size(_registry.load_image(path))
+    img.flags.writeable = False
+    return img
+
+# Hash distance limits (average hash, perceptual hash) for a candidate to go
+# on to SSIM: much more lenient for RAW-JPG pairs, somewhat more lenient when
+# either image is RAW (8x8 hashes, so at most 64 bits apart)
+RAW_JPG_HASH_THRESHOLDS = (20, 25)
+RAW_HASH_THRESHOLDS = (15, 18)
+HASH_THRESHOLDS = (10, 12)
+
+# RAW candidates are converted by external tools (dcraw, exiftool), each a
+# CPU-bound child process, so they get their own pool with one thread per
+# core rather than filling the oversubscribed one
+RAW_SEARCH_WORKERS = os.cpu_count() or 4
+
+# Created once and shared by all searches; threads are started on first use
+_SEARCH_POOL = ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="imagefinder-search")
+_RAW_SEARCH_POOL = ThreadPoolExecutor(max_workers=RAW_SEARCH_WORKERS, thread_name_prefix="imagefinder-raw-search")
 
 def find_similar_images(db_conn: sqlite3.Connection, options: SearchOptions) -> List[ImageMatch]:
     """Find similar images to the query image with enhanced RAW/JPG matching"""
@@ -472,186 +625,196 @@ def find_similar_images(db_conn: sqlite3.Connection, options: SearchOptions) ->
     
     # Load the query image
     try:
-        registry = ImageLoaderRegistry()
-        query_img = None
-        
-        for loader in registry.get_loaders():
-            if loader.can_load(options.query_path):
-                query_img = loader.load_image(options.query_path)
-                break
-                
-        if query_img is None:
+        loader = _registry.get_loader(options.query_path)
+        if loader is None:
             return []
+        query_img = loader.load_image(options.query_path)
             
-        # Compute hashes for query image
-        avg_hash = compute_average_hash(query_img)
-        p_hash = compute_perceptual_hash(query_img)
+        # Compute hashes for query image, decoded the way the scanner decodes
+        # it (see load_image); SSIM keeps the full image
+        hash_img = load_image(options.query_path, for_hashing=True) if is_jpg_query else query_img
+        avg_hash, p_hash = compute_hashes(hash_img)
+        
+        # SSIM compares both images at SSIM_SIZE
+        query_img = _to_ssim_size(query_img)
         
         if options.debug_mode:
-            logger.debug(f"Query image hashes - avgHash: {avg_hash}, pHash: {p_hash}")
+            logger.debug(f"Query image hashes - avgHash: {avg_hash:016x}, pHash: {p_hash:016x}")
         
-        # Create a more complex query based on the query type
-        cursor = db_conn.cursor()
+        # Restrict to the source prefix if one is given
+        if options.source_prefix:
+            row_filter = "source_prefix = :source_prefix"
+            filter_params = {"source_prefix": options.source_prefix}
+        else:
+            row_filter = "1=1"
+            filter_params = {}
         
-        if is_jpg_query:
-            # For JPG queries, boost the chance of finding related RAW files
-            base_filename = get_base_filename(options.query_path)
-            search_pattern = f"%{base_filename}%"
-            
-            if options.debug_mode:
-                logger.debug(f"Using filename pattern search for JPG query: {search_pattern}")
-            
-            if options.source_prefix:
-                cursor.execute(
-                    "SELECT path, source_prefix, average_hash, perceptual_hash, format FROM images "
-                    "WHERE (source_prefix = ? OR 1=0) AND (path LIKE ? OR 1=1)",
-                    (options.source_prefix, search_pattern)
-                )
-            else:
-                cursor.execute(
-                    "SELECT path, source_prefix, average_hash, perceptual_hash, format FROM images "
-                    "WHERE path LIKE ? OR 1=1",
-                    (search_pattern,)
-                )
+        # The cache key is the indexed mtime_ns, or modified_at for rows (and
+        # databases not yet upgraded by open_database) without one
+        columns = {row[1] for row in db_conn.execute("PRAGMA table_info(images)")}
+        stamp_sql = "coalesce(mtime_ns, modified_at)" if "mtime_ns" in columns else "modified_at"
+        
+        # Only rows hashed by the current algorithms are comparable with the
+        # query hashes; a table without hash_version holds only version 1 rows
+        if "hash_version" in columns:
+            version_filter = "hash_version = :hash_version"
+            stale_count = db_conn.execute(f"SELECT count(*) FROM images WHERE {row_filter} AND hash_version != ?",
+                                          tuple(filter_params.values()) + (HASH_VERSION,)).fetchone()[0]
         else:
-            # Standard query for other file types
-            if options.source_prefix:
-                cursor.execute(
-                    "SELECT path, source_prefix, average_hash, perceptual_hash, format FROM images "
-                    "WHERE source_prefix = ?",
-                    (options.source_prefix,)
-                )
-            else:
-                cursor.execute("SELECT path, source_prefix, average_hash, perceptual_hash, format FROM images")
+            version_filter = "0"
+            stale_count = db_conn.execute(f"SELECT count(*) FROM images WHERE {row_filter}",
+                                          tuple(filter_params.values())).fetchone()[0]
+        if stale_count:
+            logger.warning(f"Skipping {stale_count} images indexed with an older hash version; "
+                           f"rescan their folders to include them in searches")
+        
+        # The whole hash prefilter runs inside SQLite, so only the rows that
+        # go on to SSIM are turned into Python tuples and sent to the pools.
+        # HAMMING is one Python call per hash compared, but fetching the hash
+        # columns to popcount them in NumPy or Numba costs more than those
+        # calls (about 0.95 s against 0.75 s at a million rows). The distance
+        # limits depend on the file types of the query and the row; a RAW
+        # candidate of a JPG query is also let through by its filename, which
+        # is only checked on the RAW rows the hashes rejected. Candidates come
+        # back ranked by their closer hash.
+        db_conn.create_function("HAMMING", 2, calculate_hamming_distance, deterministic=True)
+        db_conn.create_function("RELATED_TO_QUERY", 1,
+                                lambda path: are_filenames_related(options.query_path, path), deterministic=True)
+        sql = (f"SELECT path, source_prefix, {stamp_sql}, size, is_raw_format, "
+               "(:raw_query AND format IN ('jpg', 'jpeg')) OR (:jpg_query AND is_raw_format) AS raw_jpg_pair, "
+               "HAMMING(average_hash, :avg_hash) AS avg_distance, HAMMING(perceptual_hash, :p_hash) AS p_distance "
+               f"FROM images WHERE {row_filter} AND {version_filter} "
+               "AND (CASE WHEN raw_jpg_pair THEN avg_distance <= :raw_jpg_avg OR p_distance <= :raw_jpg_p "
+               "WHEN :raw_query OR is_raw_format THEN avg_distance <= :raw_avg OR p_distance <= :raw_p "
+               "ELSE avg_distance <= :avg OR p_distance <= :p END "
+               "OR (:jpg_query AND is_raw_format AND RELATED_TO_QUERY(path))) "
+               "ORDER BY min(avg_distance, p_distance), rowid")
+        params = dict(filter_params, hash_version=HASH_VERSION,
+                      raw_query=is_raw_query, jpg_query=is_jpg_query,
+                      avg_hash=_to_db_hash(avg_hash), p_hash=_to_db_hash(p_hash),
+                      raw_jpg_avg=RAW_JPG_HASH_THRESHOLDS[0], raw_jpg_p=RAW_JPG_HASH_THRESHOLDS[1],
+                      raw_avg=RAW_HASH_THRESHOLDS[0], raw_p=RAW_HASH_THRESHOLDS[1],
+                      avg=HASH_THRESHOLDS[0], p=HASH_THRESHOLDS[1])
+        candidates = db_conn.execute(sql, params).fetchall()
         
-        rows = cursor.fetchall()
+        if options.debug_mode:
+            logger.debug(f"Hash prefilter kept {len(candidates)} images")
         
         matches = []
         processed = 0
         raw_processed = 0
         start_time = time.time()
         
-        # Process matches with ThreadPoolExecutor for parallel execution
-        mutex = Lock()
-        
-        def process_candidate(row):
-            nonlocal raw_processed
+        def load_candidate(candidate):
+            """Load a candidate that passed the prefilter at SSIM size, returning it with its SSIM threshold"""
+            (path, source_prefix, file_stamp, file_size, is_raw_candidate, raw_jpg_pair,
+             avg_hash_distance, p_hash_distance) = candidate
             
-            path, source_prefix, db_avg_hash, db_p_hash, format_str = row
+            if options.debug_mode:
+                if raw_jpg_pair:
+                    avg_threshold, p_hash_threshold = RAW_JPG_HASH_THRESHOLDS
+                    logger.debug(f"Using very lenient thresholds for RAW-JPG comparison between "
+                                f"{options.query_path} and {path}")
+                elif is_raw_query or is_raw_candidate:
+                    avg_threshold, p_hash_threshold = RAW_HASH_THRESHOLDS
+                else:
+                    avg_threshold, p_hash_threshold = HASH_THRESHOLDS
+                
+                if avg_hash_distance > avg_threshold and p_hash_distance > p_hash_threshold:
+                    logger.debug(f"Filename relationship detected between {options.query_path} and {path}, "
+                                f"forcing comparison")
+                elif is_raw_candidate or is_raw_query:
+                    logger.debug(f"RAW image potential match found: {path} "
+                                f"(avgHashDist: {avg_hash_distance}/{avg_threshold}, "
+                                f"pHashDist: {p_hash_distance}/{p_hash_threshold})")
+                else:
+                    logger.debug(f"Potential match found: {path} "
+                                f"(avgHashDist: {avg_hash_distance}/{avg_threshold}, "
+                                f"pHashDist: {p_hash_distance}/{p_hash_threshold})")
             
-            # Check if file still exists
-            if not os.path.exists(path):
+            # Load candidate image
+            try:
+                # No stat here: a cached image is served without touching the
+                # file, and one deleted since the scan fails to load and is skipped
+                candidate_img = _load_ssim_image(path, file_stamp, file_size)
+            except Exception as e:
+                if options.debug_mode:
+                    logger.warning(f"Failed to load candidate image {path}: {e}")
                 return None
             
-            # Check if the candidate is a RAW file
-            is_raw_candidate = is_raw_format(path)
-            if is_raw_candidate:
-                with mutex:
-                    raw_processed += 1
-            
-            # Calculate hamming distance
-            avg_hash_distance = calculate_hamming_distance(avg_hash, db_avg_hash)
-            p_hash_distance = calculate_hamming_distance(p_hash, db_p_hash)
-            
-            # Determine thresholds based on file types
-            if (is_raw_query and is_jpg_format(path)) or (is_jpg_query and is_raw_candidate):
-                avg_threshold = 20    # Much more lenient
-                p_hash_threshold = 25  # Much more lenient
+            # Use a more lenient SSIM threshold for RAW-JPG comparisons
+            local_threshold = options.threshold
+            if raw_jpg_pair:
+                # Lower the threshold by 20% for RAW-JPG comparisons
+                local_threshold = options.threshold * 0.8
                 
                 if options.debug_mode:
-                    logger.debug(f"Using very lenient thresholds for RAW-JPG comparison between "
-                                f"{options.query_path} and {path}")
-            elif is_raw_query or is_raw_candidate:
-                # Somewhat lenient for other RAW-involved comparisons
-                avg_threshold = 15
-                p_hash_threshold = 18
-            else:
-                # Standard thresholds for normal image comparisons
-                avg_threshold = 10
-                p_hash_threshold = 12
+                    logger.debug(f"Using reduced SSIM threshold of {local_threshold:.2f} "
+                                f"for RAW-JPG comparison with {path}")
             
-            # Special handling for filename-based matching
-            if is_jpg_query and is_raw_candidate:
-                # Check if the filenames suggest they're related
-                if are_filenames_related(options.query_path, path):
-                    if options.debug_mode:
-                        logger.debug(f"Filename relationship detected between {options.query_path} and {path}, "
-                                    f"forcing comparison")
-                    
-                    # For related filenames, force SSIM comparison regardless of hash distance
-                    avg_threshold = 64  # Essentially bypassing the check (8x8 hash has max 64 bits)
-                    p_hash_threshold = 64  # Essentially bypassing the check
+            return path, source_prefix, candidate_img, local_threshold
+        
+        def check_score(loaded, ssim_score):
+            """Turn a loaded candidate into a match if its SSIM score reaches the threshold"""
+            path, source_prefix, _, local_threshold = loaded
             
-            # If hash distance is within threshold, compute SSIM for more accurate comparison
-            if avg_hash_distance <= avg_threshold or p_hash_distance <= p_hash_threshold:
+            # If SSIM score is above threshold, add to matches
+            if ssim_score >= local_threshold:
                 if options.debug_mode:
-                    if is_raw_candidate or is_raw_query:
-                        logger.debug(f"RAW image potential match found: {path} "
-                                    f"(avgHashDist: {avg_hash_distance}/{avg_threshold}, "
-                                    f"pHashDist: {p_hash_distance}/{p_hash_threshold})")
-                    else:
-                        logger.debug(f"Potential match found: {path} "
-                                    f"(avgHashDist: {avg_hash_distance}/{avg_threshold}, "
-                                    f"pHashDist: {p_hash_distance}/{p_hash_threshold})")
+                    logger.debug(f"Match confirmed: {path} (SSIM: {ssim_score:.4f} >= {local_threshold:.4f})")
                 
-                # Load candidate image
-                try:
-                    candidate_img = None
-                    for loader in registry.get_loaders():
-                        if loader.can_load(path):
-                            candidate_img = loader.load_image(path)
-                            break
-                    
-                    if candidate_img is None:
-                        return None
-                    
-                    # Adjust threshold for RAW-JPG comparisons
-                    local_threshold = options.threshold
-                    
-                    # Use a more lenient SSIM threshold for RAW-JPG comparisons
-                    if (is_raw_query and is_jpg_format(path)) or (is_jpg_query and is_raw_format(path)):
-                        # Lower the threshold by 20% for RAW-JPG comparisons
-                        local_threshold = options.threshold * 0.8
-                        
-                        if options.debug_mode:
-                            logger.debug(f"Using reduced SSIM threshold of {local_threshold:.2f} "
-                                        f"for RAW-JPG comparison with {path}")
-                    
-                    ssim_score = compute_ssim(query_img, candidate_img)
-                    
-                    # If SSIM score is above threshold, add to matches
-                    if ssim_score >= local_threshold:
-                        if options.debug_mode:
-                            logger.debug(f"Match confirmed: {path} (SSIM: {ssim_score:.4f} >= {local_threshold:.4f})")
-                        
-                        return ImageMatch(
-                            path=path,
-                            source_prefix=source_prefix,
-                            ssim_score=ssim_score
-                        )
-                    elif options.debug_mode and (is_raw_query or is_raw_format(path)):
-                        logger.debug(f"RAW image match rejected: {path} "
-                                    f"(SSIM: {ssim_score:.4f} < {local_threshold:.4f})")
-                
-                except Exception as e:
-                    if options.debug_mode:
-                        logger.warning(f"Failed to load candidate image {path}: {e}")
+                return ImageMatch(
+                    path=path,
+                    source_prefix=source_prefix,
+                    ssim_score=ssim_score
+                )
+            elif options.debug_mode and (is_raw_query or is_raw_format(path)):
+                logger.debug(f"RAW image match rejected: {path} "
+                            f"(SSIM: {ssim_score:.4f} < {local_threshold:.4f})")
             
             return None
         
-        # Process images in parallel
-        with ThreadPoolExecutor(max_workers=8) as executor:
-            for i, result in enumerate(executor.map(process_candidate, rows)):
-                processed += 1
-                
+        def process_candidate(candidate):
+            loaded = load_candidate(candidate)
+            if loaded is None:
+                return None
+            return check_score(loaded, compute_ssim(query_img, loaded[2]))
+        
+        # With a CUDA device and enough candidates, the pools only load the
+        # images and SSIM is computed for all of them in GPU batches
+        use_gpu = TORCH_SSIM_ENABLED and len(candidates) >= SSIM_GPU_MIN_BATCH
+        worker = load_candidate if use_gpu else process_candidate
+        
+        # Process images in parallel, RAW candidates on their own pool
+        futures = [(_RAW_SEARCH_POOL if candidate[4] else _SEARCH_POOL).submit(worker, candidate)
+                   for candidate in candidates]
+        loaded_candidates = []
+        for future, candidate in zip(futures, candidates):
+            result = future.result()
+            processed += 1
+            raw_processed += candidate[4]
+            
+            if result is None:
+                pass
+            elif use_gpu:
+                loaded_candidates.append(result)
+            else:
+                matches.append(result)
+            
+            # Log progress every 100 images in debug mode
+            if options.debug_mode and processed % 100 == 0:
+                elapsed = time.time() - start_time
+                logger.debug(f"Search progress: {processed} images processed ({raw_processed} RAW) "
+                            f"in {elapsed:.2f}s")
+        
+        for start in range(0, len(loaded_candidates), SSIM_GPU_BATCH):
+            batch = loaded_candidates[start:start + SSIM_GPU_BATCH]
+            scores = batched_ssim(query_img, [loaded[2] for loaded in batch],
+                                  SSIM_WINDOW[0], SSIM_SIGMA, SSIM_C1, SSIM_C2)
+            for loaded, ssim_score in zip(batch, scores):
+                result = check_score(loaded, float(ssim_score))
                 if result is not None:
                     matches.append(result)
-                
-                # Log progress every 100 images in debug mode
-                if options.debug_mode and processed % 100 == 0:
-                    elapsed = time.time() - start_time
-                    logger.debug(f"Search progress: {processed} images processed ({raw_processed} RAW) "
-                                f"in {elapsed:.2f}s")
         
         if options.debug_mode:
             logger.debug(f"Search completed. Total images processed: {processed} ({raw_processed} RAW), "
@@ -11,26 +11,45 @@ from imagefinder.database import init_database as InitDatabase, open_database as
 from imagefinder.imageprocessor import find_similar_images as FindSimilarImages, SearchOptions
 from imagefinder.mylogging import setup_logger as SetupLogger
 from imagefinder.scanner import scan_and_store_folder as ScanAndStoreFolder, ScanOptions
-from imagefinder.utils import get_default_database_path as GetDefaultDatabasePath, parse_threshold as ParseThreshold
+from imagefinder.utils import get_default_database_path as GetDefaultDatabasePath
 
-def parse_arguments():
-    """Parse command line arguments and return them as a dictionary"""
-    parser = argparse.ArgumentParser(description="ImageFinder: Find similar images")
-    
-    # Add common arguments
-    parser.add_argument("command", nargs='?', choices=["scan", "search"], help="Command to execute")
+def parse_threshold(value):
+    """argparse type for --threshold: a float clamped to 0.0-1.0"""
+    try:
+        return max(0.0, min(1.0, float(value)))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid threshold value '{value}' (expected 0.0-1.0)")
+
+def add_common_arguments(parser):
+    """Add the options shared by both commands"""
     parser.add_argument("--database", "--db", dest="database", help="Path to the database")
     parser.add_argument("--debug", action="store_true", help="Enable debug mode")
     parser.add_argument("--logfile", help="Path to log file")
     parser.add_argument("--prefix", help="Source prefix for filtering")
+
+def parse_arguments():
+    """Parse command line arguments and return them as a dictionary"""
+    parser = argparse.ArgumentParser(description="ImageFinder: Find similar images")
+    
+    # The shared options are accepted before the command (where they carry the
+    # defaults) and after it; the command's copies are suppressed when absent,
+    # so they do not overwrite a value given before the command
+    add_common_arguments(parser)
+    parser.set_defaults(prefix="")
+    common = argparse.ArgumentParser(add_help=False, argument_default=argparse.SUPPRESS)
+    add_common_arguments(common)
+    
+    subparsers = parser.add_subparsers(dest="command", help="Command to execute")
     
     # Scan command arguments
-    parser.add_argument("--folder", help="Folder path to scan for images")
-    parser.add_argument("--force", action="store_true", help="Force rewrite existing entries")
+    scan = subparsers.add_parser("scan", parents=[common], help="Scan a folder and index its images")
+    scan.add_argument("--folder", required=True, help="Folder path to scan for images")
+    scan.add_argument("--force", action="store_true", help="Force rewrite existing entries")
     
     # Search command arguments
-    parser.add_argument("--image", help="Query image path")
-    parser.add_argument("--threshold", help="Similarity threshold (0.0-1.0)")
+    search = subparsers.add_parser("search", parents=[common], help="Search the index for similar images")
+    search.add_argument("--image", required=True, help="Query image path")
+    search.add_argument("--threshold", type=parse_threshold, default=0.8, help="Similarity threshold (0.0-1.0)")
     
     args = parser.parse_args()
     
@@ -105,13 +124,8 @@ def handle_search_command(args, db_path, debug_mode):
         print("Error: Missing query image path (use --image=PATH)")
         sys.exit(1)
         
-    # Set custom threshold if provided
-    threshold = 0.8  # Default threshold
-    if threshold_str := args.get("threshold"):
-        try:
-            threshold, _ = ParseThreshold(threshold_str)  # Using the tuple return value from parse_threshold
-        except Exception as e:
-            print(f"Warning: {e}")
+    # Threshold is validated and clamped by argparse
+    threshold = args.get("threshold", 0.8)
             
     # Get source prefix for filtering
     source_prefix = args.get("prefix", "")
@@ -195,18 +209,8 @@ def main():
         except Exception as e:
             print(f"Warning: Failed to setup logging: {e}")
     
-    # Check if required arguments are missing
-    show_usage = False
-    
+    # argparse enforces the per-command required arguments, only the command itself is optional
     if not command:
-        show_usage = True
-    elif command == "scan" and not args.get("folder"):
-        show_usage = True
-    elif command == "search" and not args.get("image"):
-        show_usage = True
-    
-    # Show usage if required arguments are missing
-    if show_usage:
         print_usage()
         sys.exit(1)
     
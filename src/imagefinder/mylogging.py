@@ -2,11 +2,16 @@
 
 import os
 import logging
+from logging.handlers import RotatingFileHandler
 import threading
 import time
 from datetime import datetime
 from typing import Optional, Any
 
+# Rotate the debug log so long scans keep a bounded footprint
+LOG_MAX_BYTES = 50_000_000
+LOG_BACKUP_COUNT = 3
+
 # Module-level variables
 logger = None
 log_file_handler = None
@@ -34,12 +39,15 @@ def setup_logger(log_file_path: str) -> Optional[Exception]:
             # Configure the logger
             logger = logging.getLogger('ImageFinder')
             logger.setLevel(logging.DEBUG)
+            # Keep records out of the root logger (benchmark.py configures it with basicConfig)
+            logger.propagate = False
             
             # Create formatter
             formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
             
-            # Create file handler
-            log_file_handler = logging.FileHandler(log_file_path)
+            # Create file handler; the file is opened on first write
+            log_file_handler = RotatingFileHandler(log_file_path, maxBytes=LOG_MAX_BYTES,
+                                                   backupCount=LOG_BACKUP_COUNT, delay=True)
             log_file_handler.setLevel(logging.DEBUG)
             log_file_handler.setFormatter(formatter)
             
@@ -77,12 +85,9 @@ def debug_log(format_str: str, *args: Any) -> None:
         format_str: Format string
         *args: Arguments for format string
     """
-    with log_mutex:
-        if is_setup and logger is not None:
-            if args:
-                logger.debug(format_str % args)
-            else:
-                logger.debug(format_str)
+    # logging.Handler serializes emits itself and only formats when the level is enabled
+    if is_setup and logger is not None:
+        logger.debug(format_str, *args)
 
 def log_error(format_str: str, *args: Any) -> None:
     """
@@ -92,12 +97,8 @@ def log_error(format_str: str, *args: Any) -> None:
         format_str: Format string
         *args: Arguments for format string
     """
-    with log_mutex:
-        if is_setup and logger is not None:
-            if args:
-                logger.error(format_str % args)
-            else:
-                logger.error(format_str)
+    if is_setup and logger is not None:
+        logger.error(format_str, *args)
 
 def log_warning(format_str: str, *args: Any) -> None:
     """
@@ -107,12 +108,8 @@ def log_warning(format_str: str, *args: Any) -> None:
         format_str: Format string
         *args: Arguments for format string
     """
-    with log_mutex:
-        if is_setup and logger is not None:
-            if args:
-                logger.warning(format_str % args)
-            else:
-                logger.warning(format_str)
+    if is_setup and logger is not None:
+        logger.warning(format_str, *args)
 
 def log_image_processed(path: str, success: bool, err_msg: str = None) -> None:
     """
@@ -123,9 +120,8 @@ def log_image_processed(path: str, success: bool, err_msg: str = None) -> None:
         success: Whether the processing was successful
         err_msg: Error message if processing failed
     """
-    with log_mutex:
-        if is_setup and logger is not None:
-            if success:
-                logger.info(f"PROCESSED: {path}")
-            else:
-                logger.error(f"FAILED: {path} - Error: {err_msg}")
\ No newline at end of file
+    if is_setup and logger is not None:
+        if success:
+            logger.info("PROCESSED: %s", path)
+        else:
+            logger.error("FAILED: %s - Error: %s", path, err_msg)
\ No newline at end of file
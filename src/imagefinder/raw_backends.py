@@ -0,0 +1,312 @@
+# src/imagefinder/raw_backends.py
+"""
+RAW conversion backends built on external tools (exiftool, dcraw) and rawpy.
+
+This module only depends on third-party packages so that scanner and
+raw_processing can both import it at module level.
+"""
+import os
+import atexit
+import tempfile
+import itertools
+import subprocess
+import threading
+import logging
+from typing import List, Optional
+import cv2
+import numpy as np
+import rawpy
+import imageio
+
+# libjpeg-turbo decodes JPEG previews straight from memory, scaled during the
+# IDCT, when PyTurboJPEG and the shared library are available
+try:
+    from turbojpeg import TurboJPEG, TJPF_GRAY
+    _TJ = TurboJPEG()
+    TURBOJPEG_ENABLED = True
+except (ImportError, OSError, RuntimeError):
+    TURBOJPEG_ENABLED = False
+
+# Output files for tools that can only write files go straight into the
+# system temp directory. Pool workers exit without running atexit handlers, so
+# nothing is left to clean up at exit: callers remove each file in a finally
+# right after reading it. Names carry the pid, so concurrent processes never
+# collide.
+_TEMP_COUNTER = itertools.count()
+
+def temp_output_path(suffix: str = ".jpg") -> str:
+    """Return a fresh path in the temp directory (the file is not created)"""
+    return os.path.join(tempfile.gettempdir(), f"imagefinder-{os.getpid()}_{next(_TEMP_COUNTER)}{suffix}")
+
+def _run_to_bytes(cmd: List[str]) -> bytes:
+    """Run an external tool and return what it wrote to stdout"""
+    return subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True).stdout
+
+class ExifToolDaemon:
+    """
+    A long-running exiftool process in -stay_open mode
+    
+    Starting exiftool means starting Perl, which costs far more than
+    extracting a preview. The daemon reads one argument per line from stdin
+    and answers each -executeN with its output followed by {readyN}, so a
+    single process serves every request made by this process.
+    """
+    
+    def __init__(self):
+        self.pid = os.getpid()
+        self._process = subprocess.Popen(
+            ["exiftool", "-stay_open", "True", "-@", "-"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL
+        )
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+    
+    def execute(self, args: List[str]) -> bytes:
+        """Run exiftool with the given arguments and return its stdout"""
+        with self._lock:
+            n = next(self._counter)
+            self._process.stdin.write("\n".join([*args, f"-execute{n}", ""]).encode())
+            self._process.stdin.flush()
+            
+            # Read the raw pipe, the output may be binary (-b)
+            sentinel = f"{{ready{n}}}\n".encode()
+            output = bytearray()
+            while not output.endswith(sentinel):
+                chunk = os.read(self._process.stdout.fileno(), 1 << 16)
+                if not chunk:
+                    raise RuntimeError(f"exiftool exited with code {self._process.wait()}")
+                output += chunk
+            return bytes(output[:-len(sentinel)])
+    
+    def close(self) -> None:
+        """Ask exiftool to exit and wait for it"""
+        # A forked child must leave its parent's daemon alone
+        if self.pid != os.getpid() or self._process.poll() is not None:
+            return
+        try:
+            self._process.stdin.write(b"-stay_open\nFalse\n")
+            self._process.stdin.close()
+            self._process.wait(timeout=5)
+        except (OSError, subprocess.TimeoutExpired):
+            self._process.kill()
+
+_EXIFTOOL: Optional[ExifToolDaemon] = None
+_EXIFTOOL_LOCK = threading.Lock()
+
+def _run_exiftool(args: List[str]) -> bytes:
+    """Run exiftool through this process's daemon, starting it on first use"""
+    global _EXIFTOOL
+    with _EXIFTOOL_LOCK:
+        # Worker processes forked from a process with a daemon start their own
+        if _EXIFTOOL is None or _EXIFTOOL.pid != os.getpid():
+            _EXIFTOOL = ExifToolDaemon()
+            atexit.register(_EXIFTOOL.close)
+        daemon = _EXIFTOOL
+    try:
+        return daemon.execute(args)
+    except Exception:
+        # The pipe state is unknown after a failure, so start over next time
+        with _EXIFTOOL_LOCK:
+            if _EXIFTOOL is daemon:
+                _EXIFTOOL = None
+        daemon.close()
+        raise
+
+def _written_size(output_path: str) -> Optional[int]:
+    """Size of a converter's output file, or None if it is missing or empty"""
+    try:
+        return os.path.getsize(output_path) or None
+    except OSError:
+        return None
+
+# The converted images are only hashed (down to 32x32 at most), so they are
+# decoded at 1/8 scale, which lets libjpeg skip most of the IDCT work. Images
+# that would come out smaller than this are decoded in full.
+MIN_REDUCED_SIDE = 32
+
+def _decode_reduced(decode, source) -> Optional[np.ndarray]:
+    """Run decode(source, flags) at 1/8 scale, falling back to a full decode for small images"""
+    img = decode(source, cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if img is not None and min(img.shape[:2]) < MIN_REDUCED_SIDE:
+        img = decode(source, cv2.IMREAD_GRAYSCALE)
+    if img is None or img.size == 0:
+        return None
+    return img
+
+def read_grayscale(path: str) -> Optional[np.ndarray]:
+    """Read a converted image file to grayscale for hashing"""
+    return _decode_reduced(cv2.imread, path)
+
+def _turbojpeg_decode(buf: bytes, scale: int) -> Optional[np.ndarray]:
+    """Decode a JPEG buffer to grayscale at 1/scale with libjpeg-turbo"""
+    try:
+        img = _TJ.decode(buf, pixel_format=TJPF_GRAY, scaling_factor=(1, scale))
+    except Exception as e:
+        logging.debug("turbojpeg decode failed, falling back to OpenCV: %s", e)
+        return None
+    return img.reshape(img.shape[:2])
+
+def decode_grayscale(buf: Optional[bytes]) -> Optional[np.ndarray]:
+    """Decode an encoded image (JPEG, PPM, ...) held in memory to grayscale for hashing"""
+    if not buf:
+        return None
+    if TURBOJPEG_ENABLED and buf[:2] == b"\xff\xd8":
+        img = _turbojpeg_decode(buf, 8)
+        if img is not None and min(img.shape) < MIN_REDUCED_SIDE:
+            img = _turbojpeg_decode(buf, 1)
+        if img is not None and img.size > 0:
+            return img
+    return _decode_reduced(cv2.imdecode, np.frombuffer(buf, np.uint8))
+
+def convert_with_rawpy(path: str, output_path: str) -> Optional[int]:
+    """Convert RAW to JPG using rawpy, returning the number of bytes written (None on failure)"""
+    try:
+        with rawpy.imread(path) as raw:
+            # Process the raw image at half size (demosaicing skipped), like
+            # the dcraw conversions
+            rgb = raw.postprocess(use_camera_wb=True, no_auto_bright=False, output_bps=8, half_size=True)
+            
+            # Save the processed image to the output path
+            imageio.imsave(output_path, rgb)
+            
+            return _written_size(output_path)
+    except Exception as e:
+        logging.warning(f"rawpy conversion failed: {e}")
+        return None
+
+def extract_preview_with_exiftool(path: str, output_path: Optional[str] = None, into_memory: bool = False):
+    """
+    Extract the embedded preview JPEG from the RAW file using exiftool
+    
+    Returns the number of bytes written to output_path, or with into_memory the
+    JPEG bytes themselves; None on failure.
+    """
+    try:
+        # Use exiftool to extract the preview image
+        # -b = output in binary mode
+        # -PreviewImage = extract the preview image
+        if into_memory:
+            return _run_exiftool(["-b", "-PreviewImage", path]) or None
+        process = subprocess.run(
+            ["exiftool", "-b", "-PreviewImage", "-w", output_path, path],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=False
+        )
+        return _written_size(output_path) if process.returncode == 0 else None
+    except Exception:
+        return None
+
+def convert_with_dcraw_auto_bright(path: str, output_path: Optional[str] = None, into_memory: bool = False):
+    """
+    Convert using dcraw with auto-brightness, which often matches camera output
+    
+    Returns the number of bytes written to output_path, or with into_memory the
+    PPM bytes dcraw wrote to stdout; None on failure.
+    """
+    try:
+        # -w = use camera white balance
+        # -a = auto-brightness (mimics camera)
+        # -h = half-size, skipping interpolation (hashing only needs 32x32)
+        # -c = write to stdout
+        # -O = output to specified file
+        if into_memory:
+            return _run_to_bytes(["dcraw", "-c", "-w", "-a", "-h", path]) or None
+        process = subprocess.run(
+            ["dcraw", "-w", "-a", "-h", "-O", output_path, path],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=False
+        )
+        return _written_size(output_path) if process.returncode == 0 else None
+    except Exception:
+        return None
+
+def convert_with_dcraw_camera_wb(path: str, output_path: Optional[str] = None, into_memory: bool = False):
+    """
+    Convert using dcraw with camera white balance, no auto-brightness
+    
+    Returns the number of bytes written to output_path, or with into_memory the
+    PPM bytes dcraw wrote to stdout; None on failure.
+    """
+    try:
+        # -w = use camera white balance
+        # -h = half-size, skipping interpolation (hashing only needs 32x32)
+        # -c = write to stdout
+        # -O = output to specified file
+        if into_memory:
+            return _run_to_bytes(["dcraw", "-c", "-w", "-h", path]) or None
+        process = subprocess.run(
+            ["dcraw", "-w", "-h", "-O", output_path, path],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=False
+        )
+        return _written_size(output_path) if process.returncode == 0 else None
+    except Exception:
+        return None
+
+# Extensions of the RAW formats handled by the converters above
+RAW_EXTENSIONS = frozenset({".dng", ".raf", ".arw", ".nef", ".cr2", ".cr3", ".nrw", ".srf"})
+
+def is_raw_format(path: str) -> bool:
+    """Check if a file is in RAW format"""
+    return os.path.splitext(path)[1].lower() in RAW_EXTENSIONS
+
+def convert_cr3_with_exiftool(path: str, output_path: Optional[str] = None, into_memory: bool = False):
+    """
+    Specialized function for CR3 files which often need special handling
+    
+    Returns the number of bytes of the first preview found written to
+    output_path, or with into_memory the preview bytes; None if there is none.
+    """
+    if into_memory:
+        # CR3 files often have multiple preview images, try the largest first
+        for tag in ["LargePreviewImage", "PreviewImage", "OtherImage", "ThumbnailImage", "FullPreviewImage"]:
+            try:
+                data = _run_exiftool(["-b", f"-{tag}", path])
+            except Exception:
+                continue
+            if data:
+                return data
+        return None
+    
+    try:
+        # CR3 files often have multiple preview images
+        # Try extracting the largest preview image
+        process = subprocess.run(
+            ["exiftool", "-b", "-LargePreviewImage", "-w", output_path, path],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            check=False
+        )
+
+        # Check if the output file was created and has content
+        if process.returncode == 0 and (size := _written_size(output_path)):
+            return size
+
+        # Try alternative tags for preview images
+        tags = [
+            "PreviewImage",
+            "OtherImage",
+            "ThumbnailImage",
+            "FullPreviewImage",
+        ]
+
+        for tag in tags:
+            process = subprocess.run(
+                ["exiftool", "-b", f"-{tag}", "-w", output_path, path],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                check=False
+            )
+
+            # Check if successful
+            if process.returncode == 0 and (size := _written_size(output_path)):
+                return size
+
+        return None
+    except Exception:
+        return None
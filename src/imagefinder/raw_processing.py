@@ -2,9 +2,20 @@
 import os
 import time
 import logging
-from pathlib import Path
 import numpy as np
 import cv2
+import rawpy
+from imagefinder.imageprocessor import _fast_box_down, _average_hash_grid, _dct_low_frequencies, _pack_hash_bits
+from imagefinder.raw_backends import (
+    convert_cr3_with_exiftool,
+    extract_preview_with_exiftool,
+    convert_with_dcraw_auto_bright,
+    convert_with_dcraw_camera_wb,
+    convert_with_rawpy,
+    decode_grayscale,
+    read_grayscale,
+    temp_output_path
+)
 
 # Try to import the Rust module
 try:
@@ -15,14 +26,20 @@ except ImportError:
     RUST_ENABLED = False
     logging.warning("Rust raw_processor module not available. Using Python implementation only.")
 
+# Numba kernels speed up the Python hash fallbacks when numba is installed
+try:
+    from imagefinder._hash_numba import ahash_kernel, phash_kernel, ahash_fused, phash_fused
+    NUMBA_ENABLED = True
+except ImportError:
+    NUMBA_ENABLED = False
+
 def convert_raw_to_jpg_and_load(path: str) -> np.ndarray:
     """
     Convert a RAW file to JPG and load it for hashing.
     Uses the Rust implementation if available, with Python fallbacks.
     """
-    temp_dir = os.path.join(os.path.expanduser("~"), "temp")
-    os.makedirs(temp_dir, exist_ok=True)
-    temp_jpg = os.path.join(temp_dir, f"std_conv_{int(time.time()*1000000)}.jpg")
+    # Named only if the Rust JPG method or rawpy runs, as they need a file
+    temp_jpg = None
     
     try:
         # First try Rust direct grayscale conversion if available
@@ -31,7 +48,8 @@ def convert_raw_to_jpg_and_load(path: str) -> np.ndarray:
                 start_time = time.time()
                 img = raw_processor.rust_raw_to_grayscale(path)
                 if img is not None and img.size > 0:
-                    logging.debug(f"Rust direct grayscale conversion successful in {time.time() - start_time:.3f}s")
+                    assert img.flags.c_contiguous, "rust_raw_to_grayscale returned a non-contiguous array"
+                    logging.debug("Rust direct grayscale conversion successful in %.3fs", time.time() - start_time)
                     return img
             except Exception as e:
                 logging.warning(f"Rust direct grayscale conversion failed: {e}, trying JPG method")
@@ -39,175 +57,152 @@ def convert_raw_to_jpg_and_load(path: str) -> np.ndarray:
                 # If direct conversion fails, try the JPG conversion method
                 try:
                     start_time = time.time()
+                    temp_jpg = temp_jpg or temp_output_path()
                     if raw_processor.rust_convert_raw_to_jpg(path, temp_jpg):
-                        if os.path.isfile(temp_jpg) and os.path.getsize(temp_jpg) > 0:
-                            img = cv2.imread(temp_jpg, cv2.IMREAD_GRAYSCALE)
-                            if img is not None and img.size > 0:
-                                logging.debug(f"Rust JPG conversion successful in {time.time() - start_time:.3f}s")
-                                return img
+                        img = read_grayscale(temp_jpg)
+                        if img is not None and img.size > 0:
+                            logging.debug("Rust JPG conversion successful in %.3fs", time.time() - start_time)
+                            return img
                 except Exception as e:
                     logging.warning(f"Rust JPG conversion failed: {e}, falling back to Python implementation")
         
-        # Fall back to Python implementation - import them locally to avoid circular imports
-        from imagefinder.scanner import (
-            convert_cr3_with_exiftool,
-            extract_preview_with_exiftool,
-            convert_with_dcraw_auto_bright,
-            convert_with_dcraw_camera_wb,
-            convert_with_rawpy,
-            is_raw_format
-        )
-        
+        # Fall back to Python implementation
         logging.debug("Using Python implementation for RAW conversion")
         
         # Special handling for CR3 files
-        if Path(path).suffix.lower() == ".cr3":
-            if convert_cr3_with_exiftool(path, temp_jpg):
-                if os.path.isfile(temp_jpg) and os.path.getsize(temp_jpg) > 0:
-                    img = cv2.imread(temp_jpg, cv2.IMREAD_GRAYSCALE)
-                    if img is not None and img.size > 0:
-                        return img
+        if path.lower().endswith(".cr3"):
+            img = decode_grayscale(convert_cr3_with_exiftool(path, into_memory=True))
+            if img is not None:
+                return img
         
-        # Try different conversion methods
+        # Try different conversion methods; the external tools stream their
+        # output to stdout so it is decoded in memory without a temp file
         methods = [
             extract_preview_with_exiftool,
             convert_with_dcraw_auto_bright,
             convert_with_dcraw_camera_wb,
-            convert_with_rawpy,
         ]
         
         last_error = None
         for method in methods:
             try:
                 start_time = time.time()
-                if method(path, temp_jpg):
-                    if os.path.isfile(temp_jpg) and os.path.getsize(temp_jpg) > 0:
-                        img = cv2.imread(temp_jpg, cv2.IMREAD_GRAYSCALE)
-                        if img is not None and img.size > 0:
-                            method_name = method.__name__
-                            logging.debug(f"{method_name} successful in {time.time() - start_time:.3f}s")
-                            return img
+                img = decode_grayscale(method(path, into_memory=True))
+                if img is not None:
+                    method_name = method.__name__
+                    logging.debug("%s successful in %.3fs", method_name, time.time() - start_time)
+                    return img
             except Exception as e:
                 last_error = e
                 continue
         
+        # rawpy + imageio can only write to a file
+        try:
+            start_time = time.time()
+            temp_jpg = temp_jpg or temp_output_path()
+            if convert_with_rawpy(path, temp_jpg):
+                img = read_grayscale(temp_jpg)
+                if img is not None and img.size > 0:
+                    logging.debug("convert_with_rawpy successful in %.3fs", time.time() - start_time)
+                    return img
+        except Exception as e:
+            last_error = e
+        
         # If all external tools fail, try direct rawpy processing as a final fallback
         try:
-            import rawpy
             start_time = time.time()
             with rawpy.imread(path) as raw:
-                rgb = raw.postprocess()
+                rgb = raw.postprocess(half_size=True)
                 img = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
                 if img is not None and img.size > 0:
-                    logging.debug(f"Direct rawpy processing successful in {time.time() - start_time:.3f}s")
+                    logging.debug("Direct rawpy processing successful in %.3fs", time.time() - start_time)
                     return img
         except Exception as rawpy_error:
             last_error = rawpy_error
         
         raise ValueError(f"Failed to convert RAW to JPG: {last_error}")
     finally:
-        if os.path.exists(temp_jpg):
+        if temp_jpg is not None:
             try:
                 os.remove(temp_jpg)
-            except:
+            except OSError:
                 pass
 
-def compute_average_hash(img: np.ndarray) -> str:
+def compute_average_hash(img: np.ndarray) -> int:
     """
-    Compute average hash for image indexing.
+    Compute average hash for image indexing as a 64-bit unsigned integer.
     Uses the Rust implementation if available, with Python fallback.
     """
-    # Resize to 8x8
-    resized = cv2.resize(img, (8, 8), interpolation=cv2.INTER_AREA)
+    # Every loader decodes to 8-bit grayscale
+    assert img.ndim == 2 and img.dtype == np.uint8, "expected a 2D uint8 grayscale image"
     
-    # Convert to grayscale if not already
-    if len(resized.shape) > 2:
-        gray = cv2.cvtColor(resized, cv2.COLOR_BGR2GRAY)
-    else:
-        gray = resized
+    # Without Rust, Numba downsamples and hashes in one pass over the image
+    # (same result as the block-averaging path of _fast_box_down below)
+    if NUMBA_ENABLED and not RUST_ENABLED and min(img.shape) >= 32 * 32 and img.flags.c_contiguous:
+        return ahash_fused(img)
+    
+    # Resize to 8x8 by way of the 32x32 pHash image
+    gray = _average_hash_grid(_fast_box_down(img, 32))
     
     # Use Rust implementation if available
     if RUST_ENABLED:
         try:
             start_time = time.time()
-            hash_str = raw_processor.rust_compute_average_hash(gray)
-            logging.debug(f"Rust average hash computation successful in {time.time() - start_time:.6f}s")
-            return hash_str
+            hash_value = int(raw_processor.rust_compute_average_hash(gray), 2)
+            logging.debug("Rust average hash computation successful in %.6fs", time.time() - start_time)
+            return hash_value
         except Exception as e:
             logging.warning(f"Rust hash computation failed: {e}, falling back to Python")
     
     # Fall back to Python implementation
+    if NUMBA_ENABLED:
+        return ahash_kernel(np.ascontiguousarray(gray))
+    
     start_time = time.time()
     avg_pixel_value = gray.mean()
     
-    # Compute the hash
-    hash_str = ""
-    for i in range(8):
-        for j in range(8):
-            if gray[i, j] >= avg_pixel_value:
-                hash_str += "1"
-            else:
-                hash_str += "0"
+    # Compute the hash: one bit per pixel, set where the pixel is at least the mean
+    mask = gray >= avg_pixel_value
+    hash_value = _pack_hash_bits(mask)
     
-    logging.debug(f"Python average hash computation completed in {time.time() - start_time:.6f}s")
-    return hash_str
+    logging.debug("Python average hash computation completed in %.6fs", time.time() - start_time)
+    return hash_value
 
-def compute_perceptual_hash(img: np.ndarray) -> str:
+def compute_perceptual_hash(img: np.ndarray) -> int:
     """
-    Compute perceptual hash (pHash) for better matching.
+    Compute perceptual hash (pHash) for better matching as a 64-bit unsigned integer.
     Uses the Rust implementation if available, with Python fallback.
     """
-    # Resize to 32x32
-    resized = cv2.resize(img, (32, 32), interpolation=cv2.INTER_AREA)
+    # Every loader decodes to 8-bit grayscale
+    assert img.ndim == 2 and img.dtype == np.uint8, "expected a 2D uint8 grayscale image"
     
-    # Convert to grayscale if not already
-    if len(resized.shape) > 2:
-        gray = cv2.cvtColor(resized, cv2.COLOR_BGR2GRAY)
-    else:
-        gray = resized
+    # Without Rust, Numba downsamples and hashes in one pass over the image
+    # (same result as the block-averaging path of _fast_box_down below)
+    if NUMBA_ENABLED and not RUST_ENABLED and min(img.shape) >= 32 * 32 and img.flags.c_contiguous:
+        return phash_fused(img)
+    
+    # Resize to 32x32
+    gray = _fast_box_down(img, 32)
     
     # Use Rust implementation if available
     if RUST_ENABLED:
         try:
             start_time = time.time()
-            hash_str = raw_processor.rust_compute_perceptual_hash(gray)
-            logging.debug(f"Rust perceptual hash computation successful in {time.time() - start_time:.6f}s")
-            return hash_str
+            hash_value = int(raw_processor.rust_compute_perceptual_hash(gray), 2)
+            logging.debug("Rust perceptual hash computation successful in %.6fs", time.time() - start_time)
+            return hash_value
         except Exception as e:
             logging.warning(f"Rust perceptual hash computation failed: {e}, falling back to Python")
     
     # Fall back to Python implementation
-    start_time = time.time()
-    regions = 8  # 8x8 regions
-    region_values = []
-    
-    # Calculate average brightness in each region
-    region_height = gray.shape[0] // regions
-    region_width = gray.shape[1] // regions
+    if NUMBA_ENABLED:
+        return phash_kernel(np.ascontiguousarray(gray))
     
-    for i in range(regions):
-        for j in range(regions):
-            # Calculate region boundaries
-            start_y = i * region_height
-            end_y = (i + 1) * region_height
-            start_x = j * region_width
-            end_x = (j + 1) * region_width
-            
-            # Calculate average for region
-            region = gray[start_y:end_y, start_x:end_x]
-            avg = np.mean(region)
-            region_values.append(avg)
-    
-    # Calculate median
-    median = np.median(region_values)
-    
-    # Create hash based on whether each value is above median
-    hash_str = ""
-    for val in region_values:
-        if val > median:
-            hash_str += "1"
-        else:
-            hash_str += "0"
+    start_time = time.time()
+    # Low-frequency DCT coefficients, thresholded at the median of the AC terms
+    low_freqs = _dct_low_frequencies(gray)
+    median = np.median(low_freqs.ravel()[1:])
+    hash_value = _pack_hash_bits(low_freqs > median)
     
-    logging.debug(f"Python perceptual hash computation completed in {time.time() - start_time:.6f}s")
-    return hash_str
+    logging.debug("Python perceptual hash computation completed in %.6fs", time.time() - start_time)
+    return hash_value
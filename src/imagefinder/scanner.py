@@ -1,7 +1,41 @@
-# Modified portions of scanner.py to use the Rust-powered implementations
+#!/usr/bin/env python3
 
-# 1. At the top of scanner.py, add this import
+import os
+import time
+import sqlite3
 import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Tuple, Optional
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+import cv2
+import numpy as np
+import rawpy
+from PIL import Image
+
+# Import local modules with relative imports
+from imagefinder.database import (
+    get_indexed_file_states,
+    store_file_mtimes,
+    store_image_infos,
+    STORE_BATCH_SIZE
+)
+from imagefinder.imageprocessor import load_image, ImageLoaderRegistry, _fast_box_down, _average_hash_grid, _dct_low_frequencies, _pack_hash_bits
+from imagefinder.image_types import ImageInfo
+from imagefinder.raw_backends import (
+    convert_with_rawpy,
+    extract_preview_with_exiftool,
+    convert_with_dcraw_auto_bright,
+    convert_with_dcraw_camera_wb,
+    is_raw_format,
+    convert_cr3_with_exiftool,
+    decode_grayscale,
+    read_grayscale,
+    temp_output_path
+)
 
 # Try to import Rust implementation
 try:
@@ -12,122 +46,251 @@ except ImportError:
     RUST_ENABLED = False
     logging.warning("Rust raw_processor module not available. Using Python implementation only.")
 
-# 2. Replace or modify the existing hash functions
+# Numba kernels speed up the Python hash fallbacks when numba is installed
+try:
+    from imagefinder._hash_numba import ahash_kernel, phash_kernel, ahash_fused, phash_fused, hashes_fused
+    NUMBA_ENABLED = True
+except ImportError:
+    NUMBA_ENABLED = False
+
+@dataclass
+class ScanOptions:
+    """Options for image scanning"""
+    folder_path: str
+    source_prefix: str
+    force_rewrite: bool
+    debug_mode: bool
+    db_path: str
+
+@dataclass
+class ProcessImageResult:
+    """Result of processing an image"""
+    path: str
+    success: bool
+    error: Optional[str] = None
+
+@dataclass
+class ScanCounts:
+    """Tally of the finished files of a scan"""
+    processed: int = 0
+    errors: int = 0
+    raw_processed: int = 0
+    raw_errors: int = 0
+
+def _stored_mtime(modified_at: str) -> float:
+    """Convert a stored modified_at string to a POSIX timestamp (raises ValueError)"""
+    return datetime.strptime(modified_at, "%Y-%m-%dT%H:%M:%S%z").timestamp()
+
+def process_image(path: str, source_prefix: str, options: ScanOptions,
+                  file_info: Optional[os.stat_result] = None) -> Tuple[ProcessImageResult, Optional[ImageInfo]]:
+    """
+    Load and hash a single image without touching the database
+    
+    Safe to run in a worker process; returns the result and, on success, the
+    ImageInfo to store. file_info is the file's stat result if the caller
+    already has it.
+    """
+    result = ProcessImageResult(
+        path=path,
+        success=False
+    )
+
+    # Get file info
+    if file_info is None:
+        try:
+            file_info = os.stat(path)
+        except OSError as e:
+            result.error = f"Cannot stat file {path}: {str(e)}"
+            return result, None
+
+    # Get file format from extension (without the dot)
+    file_format = os.path.splitext(path)[1][1:].lower()
+
+    # Detect if this is a RAW image
+    is_raw_image = is_raw_format(path)
+
+    # Load and process the image - for RAW files, convert to JPG first
+    try:
+        if is_raw_image:
+            if options.debug_mode:
+                logging.debug(f"Converting RAW image to JPG for consistent hashing: {path}")
+
+            # First try our dedicated RAW to JPG conversion
+            try:
+                img = convert_raw_to_jpg_and_load(path)
+                if options.debug_mode:
+                    logging.debug(f"Successfully converted RAW to JPG for: {path}")
+            except Exception as e:
+                if options.debug_mode:
+                    logging.warning(f"RAW to JPG conversion failed: {e}, falling back to standard loader")
+                img = load_image(path)
+        else:
+            # For non-RAW files, load normally (JPEGs at reduced scale, only
+            # the hashes need the pixels)
+            img = load_image(path, for_hashing=True)
+
+        # Make sure the image loaded successfully
+        if img is None or img.size == 0:
+            result.error = f"Failed to load image {path}: Image is empty"
+            return result, None
+
+        # Compute hashes
+        avg_hash, p_hash = compute_hashes(img)
+
+        # Log hash information for debugging raw images
+        if options.debug_mode and is_raw_image:
+            logging.debug(f"RAW image hashes - {path} - avgHash: {avg_hash:016x}, pHash: {p_hash:016x}")
+
+        # The reduced JPEG decode does not give the real dimensions, the
+        # header does
+        height, width = img.shape[:2]
+        if not is_raw_image and file_format in ('jpg', 'jpeg'):
+            try:
+                with Image.open(path) as header:
+                    width, height = header.size
+            except Exception:
+                pass
+
+        # Create ImageInfo object
+        image_info = ImageInfo(
+            id=0,  # Will be assigned by the database
+            path=path,
+            source_prefix=source_prefix,
+            format=file_format,
+            width=width,
+            height=height,
+            created_at="",  # Will be set by database
+            modified_at=time.strftime("%Y-%m-%dT%H:%M:%S%z", time.localtime(file_info.st_mtime)),
+            size=file_info.st_size,
+            average_hash=avg_hash,
+            perceptual_hash=p_hash,
+            is_raw_format=is_raw_image,
+            mtime_ns=file_info.st_mtime_ns
+        )
+
+        result.success = True
+        return result, image_info
 
-def compute_average_hash(img: np.ndarray) -> str:
-    """Compute average hash for image indexing"""
-    # Resize to 8x8
-    resized = cv2.resize(img, (8, 8), interpolation=cv2.INTER_AREA)
+    except Exception as e:
+        result.error = f"Error processing {path}: {str(e)}"
+        return result, None
+
+# Number of files sent to a scan worker at a time
+SCAN_CHUNK_SIZE = 32
+
+# Seconds the writer thread waits for more results before committing a
+# partial batch, so slow scans still store their progress regularly
+WRITE_FLUSH_INTERVAL = 1.0
+
+def process_images(paths: List[str], file_infos: List[Optional[os.stat_result]], source_prefix: str,
+                   options: ScanOptions) -> List[Tuple[ProcessImageResult, Optional[ImageInfo]]]:
+    """Run process_image over a chunk of files, so one worker round trip covers many files"""
+    return [process_image(path, source_prefix, options, file_info) for path, file_info in zip(paths, file_infos)]
+
+def compute_average_hash(img: np.ndarray, use_rust: bool = True) -> int:
+    """Compute the 64-bit average hash for image indexing, using the Rust implementation when use_rust is set"""
+    # Every loader decodes to 8-bit grayscale
+    assert img.ndim == 2 and img.dtype == np.uint8, "expected a 2D uint8 grayscale image"
     
-    # Convert to grayscale if not already
-    if len(resized.shape) > 2:
-        gray = cv2.cvtColor(resized, cv2.COLOR_BGR2GRAY)
-    else:
-        gray = resized
+    # Without Rust, Numba downsamples and hashes in one pass over the image
+    # (same result as the block-averaging path of _fast_box_down below)
+    if NUMBA_ENABLED and not (use_rust and RUST_ENABLED) and min(img.shape) >= 32 * 32 and img.flags.c_contiguous:
+        return ahash_fused(img)
+    
+    # Resize to 8x8 by way of the 32x32 pHash image
+    gray = _average_hash_grid(_fast_box_down(img, 32))
     
     # Use Rust implementation if available
-    if RUST_ENABLED:
+    if use_rust and RUST_ENABLED:
         try:
             start_time = time.time()
-            hash_str = raw_processor.rust_compute_average_hash(gray)
+            hash_value = int(raw_processor.rust_compute_average_hash(gray), 2)
             if logging.getLogger().isEnabledFor(logging.DEBUG):
                 logging.debug(f"Rust average hash computation took {time.time() - start_time:.6f}s")
-            return hash_str
+            return hash_value
         except Exception as e:
             logging.warning(f"Rust hash computation failed: {e}, falling back to Python")
     
     # Fall back to Python implementation
     start_time = time.time()
+    if NUMBA_ENABLED:
+        return ahash_kernel(np.ascontiguousarray(gray))
+    
     avg_pixel_value = gray.mean()
     
-    # Compute the hash
-    hash_str = ""
-    for i in range(8):
-        for j in range(8):
-            if gray[i, j] >= avg_pixel_value:
-                hash_str += "1"
-            else:
-                hash_str += "0"
+    # Compute the hash: one bit per pixel, set where the pixel is at least the mean
+    mask = gray >= avg_pixel_value
+    hash_value = _pack_hash_bits(mask)
     
     if logging.getLogger().isEnabledFor(logging.DEBUG):
         logging.debug(f"Python average hash computation took {time.time() - start_time:.6f}s")
-    return hash_str
+    return hash_value
 
-def compute_perceptual_hash(img: np.ndarray) -> str:
-    """Compute perceptual hash (pHash) for better matching"""
-    # Resize to 32x32
-    resized = cv2.resize(img, (32, 32), interpolation=cv2.INTER_AREA)
+def compute_perceptual_hash(img: np.ndarray, use_rust: bool = True) -> int:
+    """Compute the 64-bit perceptual hash (pHash) for better matching, using the Rust implementation when use_rust is set"""
+    # Every loader decodes to 8-bit grayscale
+    assert img.ndim == 2 and img.dtype == np.uint8, "expected a 2D uint8 grayscale image"
+    
+    # Without Rust, Numba downsamples and hashes in one pass over the image
+    # (same result as the block-averaging path of _fast_box_down below)
+    if NUMBA_ENABLED and not (use_rust and RUST_ENABLED) and min(img.shape) >= 32 * 32 and img.flags.c_contiguous:
+        return phash_fused(img)
     
-    # Convert to grayscale if not already
-    if len(resized.shape) > 2:
-        gray = cv2.cvtColor(resized, cv2.COLOR_BGR2GRAY)
-    else:
-        gray = resized
+    # Resize to 32x32
+    gray = _fast_box_down(img, 32)
     
     # Use Rust implementation if available
-    if RUST_ENABLED:
+    if use_rust and RUST_ENABLED:
         try:
             start_time = time.time()
-            hash_str = raw_processor.rust_compute_perceptual_hash(gray)
+            hash_value = int(raw_processor.rust_compute_perceptual_hash(gray), 2)
             if logging.getLogger().isEnabledFor(logging.DEBUG):
                 logging.debug(f"Rust perceptual hash computation took {time.time() - start_time:.6f}s")
-            return hash_str
+            return hash_value
         except Exception as e:
             logging.warning(f"Rust perceptual hash computation failed: {e}, falling back to Python")
     
     # Fall back to Python implementation
     start_time = time.time()
-    regions = 8  # 8x8 regions
-    region_values = []
-    
-    # Calculate average brightness in each region
-    region_height = gray.shape[0] // regions
-    region_width = gray.shape[1] // regions
-    
-    for i in range(regions):
-        for j in range(regions):
-            # Calculate region boundaries
-            start_y = i * region_height
-            end_y = (i + 1) * region_height
-            start_x = j * region_width
-            end_x = (j + 1) * region_width
-            
-            # Calculate average for region
-            region = gray[start_y:end_y, start_x:end_x]
-            avg = np.mean(region)
-            region_values.append(avg)
-    
-    # Calculate median
-    median = np.median(region_values)
-    
-    # Create hash based on whether each value is above median
-    hash_str = ""
-    for val in region_values:
-        if val > median:
-            hash_str += "1"
-        else:
-            hash_str += "0"
+    if NUMBA_ENABLED:
+        return phash_kernel(np.ascontiguousarray(gray))
+    
+    # DCT-based pHash: the 8x8 lowest frequencies against the median of their AC terms
+    low_freqs = _dct_low_frequencies(gray)
+    median = np.median(low_freqs.ravel()[1:])
+    hash_value = _pack_hash_bits(low_freqs > median)
     
     if logging.getLogger().isEnabledFor(logging.DEBUG):
         logging.debug(f"Python perceptual hash computation took {time.time() - start_time:.6f}s")
-    return hash_str
+    return hash_value
 
-# 3. Modify the RAW conversion function
+def compute_hashes(img: np.ndarray, use_rust: bool = True) -> Tuple[int, int]:
+    """Compute the average and perceptual hash, downsampling the image only once"""
+    assert img.ndim == 2 and img.dtype == np.uint8, "expected a 2D uint8 grayscale image"
+    
+    if NUMBA_ENABLED and not (use_rust and RUST_ENABLED) and min(img.shape) >= 32 * 32 and img.flags.c_contiguous:
+        return hashes_fused(img)
+    
+    # Both hashes start from the 32x32 image and take it as is
+    gray = _fast_box_down(img, 32)
+    return compute_average_hash(gray, use_rust), compute_perceptual_hash(gray, use_rust)
 
-def convert_raw_to_jpg_and_load(path: str) -> np.ndarray:
-    """Convert a RAW file to JPG and load it for hashing."""
-    temp_dir = os.path.join(os.path.expanduser("~"), "temp")
-    os.makedirs(temp_dir, exist_ok=True)
-    temp_jpg = os.path.join(temp_dir, f"std_conv_{int(time.time()*1000000)}.jpg")
+def convert_raw_to_jpg_and_load(path: str, use_rust: bool = True) -> np.ndarray:
+    """Convert a RAW file to JPG and load it for hashing, trying the Rust implementation first when use_rust is set"""
+    # Only the Rust JPG method and rawpy need a file; it is named when one of
+    # them runs, so the in-memory paths never touch the scratch directory
+    temp_jpg = None
     
     try:
         # Try Rust implementation if available
-        if RUST_ENABLED:
+        if use_rust and RUST_ENABLED:
             try:
                 # First try direct grayscale conversion
                 start_time = time.time()
                 img = raw_processor.rust_raw_to_grayscale(path)
                 if img is not None and img.size > 0:
+                    # The array wraps the Rust buffer (no copy) and is only read from here on
+                    assert img.flags.c_contiguous, "rust_raw_to_grayscale returned a non-contiguous array"
                     if logging.getLogger().isEnabledFor(logging.DEBUG):
                         logging.debug(f"Rust direct grayscale conversion took {time.time() - start_time:.3f}s")
                     return img
@@ -137,54 +300,63 @@ def convert_raw_to_jpg_and_load(path: str) -> np.ndarray:
                 # If direct conversion fails, try the JPG conversion method
                 try:
                     start_time = time.time()
+                    temp_jpg = temp_jpg or temp_output_path()
                     if raw_processor.rust_convert_raw_to_jpg(path, temp_jpg):
-                        if os.path.isfile(temp_jpg) and os.path.getsize(temp_jpg) > 0:
-                            img = cv2.imread(temp_jpg, cv2.IMREAD_GRAYSCALE)
-                            if img is not None and img.size > 0:
-                                if logging.getLogger().isEnabledFor(logging.DEBUG):
-                                    logging.debug(f"Rust JPG conversion took {time.time() - start_time:.3f}s")
-                                return img
+                        img = read_grayscale(temp_jpg)
+                        if img is not None and img.size > 0:
+                            if logging.getLogger().isEnabledFor(logging.DEBUG):
+                                logging.debug(f"Rust JPG conversion took {time.time() - start_time:.3f}s")
+                            return img
                 except Exception as e:
                     logging.warning(f"Rust JPG conversion failed: {e}, falling back to Python implementation")
         
         # Continue with existing Python implementation
         # Special handling for CR3 files
-        if Path(path).suffix.lower() == ".cr3":
-            if convert_cr3_with_exiftool(path, temp_jpg):
-                if os.path.isfile(temp_jpg) and os.path.getsize(temp_jpg) > 0:
-                    img = cv2.imread(temp_jpg, cv2.IMREAD_GRAYSCALE)
-                    if img is not None and img.size > 0:
-                        return img
+        if path.lower().endswith(".cr3"):
+            img = decode_grayscale(convert_cr3_with_exiftool(path, into_memory=True))
+            if img is not None:
+                return img
                         
-        # Try different conversion methods
+        # Try different conversion methods; the external tools stream their
+        # output to stdout so it is decoded in memory without a temp file
         methods = [
             extract_preview_with_exiftool,
             convert_with_dcraw_auto_bright,
             convert_with_dcraw_camera_wb,
-            convert_with_rawpy,
         ]
         
         last_error = None
         for method in methods:
             try:
                 start_time = time.time()
-                if method(path, temp_jpg):
-                    if os.path.isfile(temp_jpg) and os.path.getsize(temp_jpg) > 0:
-                        img = cv2.imread(temp_jpg, cv2.IMREAD_GRAYSCALE)
-                        if img is not None and img.size > 0:
-                            method_name = method.__name__
-                            if logging.getLogger().isEnabledFor(logging.DEBUG):
-                                logging.debug(f"{method_name} took {time.time() - start_time:.3f}s")
-                            return img
+                img = decode_grayscale(method(path, into_memory=True))
+                if img is not None:
+                    method_name = method.__name__
+                    if logging.getLogger().isEnabledFor(logging.DEBUG):
+                        logging.debug(f"{method_name} took {time.time() - start_time:.3f}s")
+                    return img
             except Exception as e:
                 last_error = e
                 continue
+        
+        # rawpy + imageio can only write to a file
+        try:
+            start_time = time.time()
+            temp_jpg = temp_jpg or temp_output_path()
+            if convert_with_rawpy(path, temp_jpg):
+                img = read_grayscale(temp_jpg)
+                if img is not None and img.size > 0:
+                    if logging.getLogger().isEnabledFor(logging.DEBUG):
+                        logging.debug(f"convert_with_rawpy took {time.time() - start_time:.3f}s")
+                    return img
+        except Exception as e:
+            last_error = e
                 
         # If all external tools fail, try direct rawpy processing as a final fallback
         try:
             start_time = time.time()
             with rawpy.imread(path) as raw:
-                rgb = raw.postprocess()
+                rgb = raw.postprocess(half_size=True)
                 img = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY)
                 if img is not None and img.size > 0:
                     if logging.getLogger().isEnabledFor(logging.DEBUG):
@@ -195,8 +367,265 @@ def convert_raw_to_jpg_and_load(path: str) -> np.ndarray:
             
         raise ValueError(f"Failed to convert RAW to JPG: {last_error}")
     finally:
-        if os.path.exists(temp_jpg):
+        if temp_jpg is not None:
             try:
                 os.remove(temp_jpg)
-            except:
-                pass
\ No newline at end of file
+            except OSError:
+                pass
+
+def _walk_files(folder_path: str):
+    """
+    Yield an os.DirEntry for every file below folder_path
+    
+    Like os.walk, symlinked directories are listed but not descended into and
+    unreadable directories are skipped.
+    """
+    pending_dirs = [folder_path]
+    while pending_dirs:
+        try:
+            with os.scandir(pending_dirs.pop()) as entries:
+                for entry in entries:
+                    try:
+                        is_dir = entry.is_dir()
+                    except OSError:
+                        is_dir = False
+                    if not is_dir:
+                        yield entry
+                    elif not entry.is_symlink():
+                        pending_dirs.append(entry.path)
+        except OSError:
+            continue
+
+def _is_unchanged(state: Tuple[int, Optional[int], str], file_stat: os.stat_result) -> bool:
+    """Check a file's stat against its stored (size, mtime_ns, modified_at) state"""
+    size, mtime_ns, modified_at = state
+    if mtime_ns is not None:
+        return size == file_stat.st_size and mtime_ns == file_stat.st_mtime_ns
+    
+    # Rows indexed before mtime_ns was stored: compare modification times at
+    # the second resolution of modified_at
+    try:
+        stored_time = _stored_mtime(modified_at)
+    except ValueError:
+        return False
+    return not int(file_stat.st_mtime) > stored_time
+
+def _init_scan_worker() -> None:
+    """Limit OpenCV to one thread per scan worker; the pool already uses every core"""
+    cv2.setNumThreads(1)
+
+def scan_and_store_folder(db_conn: sqlite3.Connection, options: ScanOptions) -> None:
+    """Scan a folder and store image information in the database"""
+    # Prepare registry for file type checking
+    registry = ImageLoaderRegistry()
+    
+    if options.debug_mode:
+        logging.debug(f"Starting image scan on folder: {options.folder_path}")
+        logging.debug(f"Force rewrite: {options.force_rewrite}, Source prefix: {options.source_prefix}")
+    
+    print("Starting image indexing...")
+    print(f"Force rewrite mode: {options.force_rewrite}")
+    if options.source_prefix:
+        print(f"Source prefix: {options.source_prefix}")
+    if options.debug_mode:
+        print("Debug mode: enabled")
+    
+    # Variables for tracking progress. Files are hashed while the folder is
+    # still being walked, so the totals grow until the walk is done. Each
+    # thread tallies into its own ScanCounts, so no lock is needed: this
+    # thread counts skipped and failed files, the writer thread stored ones.
+    total_files = 0
+    raw_files = 0
+    walk_counts = ScanCounts()
+    write_counts = ScanCounts()
+    last_progress = time.monotonic()
+    
+    def show_progress(final=False):
+        # Called from the walk, at most every half second; the writer
+        # thread's counts may lag by a batch
+        nonlocal last_progress
+        now = time.monotonic()
+        if not final and now - last_progress < 0.5:
+            return
+        last_progress = now
+        processed = walk_counts.processed + write_counts.processed
+        errors = walk_counts.errors + write_counts.errors
+        raw_processed = walk_counts.raw_processed + write_counts.raw_processed
+        if errors > 0:
+            print(f"\rProgress: {processed}/{total_files} found (Errors: {errors}, RAW: {raw_processed}/{raw_files})", end="")
+        else:
+            print(f"\rProgress: {processed}/{total_files} found (RAW: {raw_processed}/{raw_files})", end="")
+    
+    # Process files with ProcessPoolExecutor
+    start_time = time.time()
+
+    def record_result(counts, result, is_raw=None):
+        # Check if this is a RAW file, unless the caller already knows
+        if is_raw is None:
+            is_raw = is_raw_format(result.path)
+        
+        counts.processed += 1
+        
+        if is_raw:
+            counts.raw_processed += 1
+            if not result.success:
+                counts.raw_errors += 1
+        
+        if not result.success:
+            counts.errors += 1
+            if options.debug_mode:
+                logging.error(f"Error processing image {result.path}: {result.error}")
+        elif options.debug_mode:
+            logging.debug(f"Successfully processed image: {result.path}")
+    
+    # Decoding and hashing run in worker processes so the Python-level work
+    # (loaders, hash fallbacks) uses every core. The Rust hash functions release
+    # the GIL, so threads would also scale for hash-only work. All database
+    # writes go through a single writer thread on this connection, batched
+    # into one transaction per STORE_BATCH_SIZE images, so collecting results
+    # never waits on a commit.
+    write_queue = queue.Queue(maxsize=4 * STORE_BATCH_SIZE)
+    
+    def store_batch(batch):
+        try:
+            store_image_infos(db_conn, [image_info for _, image_info in batch], options.force_rewrite)
+        except Exception as e:
+            for result, _ in batch:
+                result.success = False
+                result.error = f"Error processing {result.path}: {str(e)}"
+        for result, image_info in batch:
+            if result.success and options.debug_mode and image_info.is_raw_format:
+                logging.debug(f"Successfully indexed RAW image: {result.path}")
+            record_result(write_counts, result, image_info.is_raw_format)
+    
+    def write_results():
+        batch = []
+        while True:
+            try:
+                item = write_queue.get(timeout=WRITE_FLUSH_INTERVAL if batch else None)
+            except queue.Empty:
+                # Workers are busy (e.g. slow RAW conversions), commit what is pending
+                store_batch(batch)
+                batch = []
+                continue
+            # None marks the end of the results
+            if item is None:
+                break
+            batch.append(item)
+            if len(batch) >= STORE_BATCH_SIZE:
+                store_batch(batch)
+                batch = []
+        if batch:
+            store_batch(batch)
+    
+    def collect(future):
+        for result, image_info in future.result():
+            if image_info is None:
+                record_result(walk_counts, result)
+            else:
+                write_queue.put((result, image_info))
+    
+    # Unchanged images are skipped up front. The stored file states are loaded
+    # in one query, so each file costs a single stat, which is handed on to the
+    # worker when it was already taken here.
+    indexed = {} if options.force_rewrite else get_indexed_file_states(db_conn, options.source_prefix)
+    legacy_unchanged = []
+    
+    workers = os.cpu_count() or 1
+    writer_thread = threading.Thread(target=write_results, name="imagefinder-writer")
+    writer_thread.start()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_scan_worker) as executor:
+            # Files are sent to the workers in chunks while the folder is
+            # walked, with a bounded number of chunks in flight
+            in_flight = deque()
+            chunk_paths = []
+            chunk_stats = []
+            
+            def submit_chunk():
+                in_flight.append(executor.submit(process_images, chunk_paths[:], chunk_stats[:],
+                                                 options.source_prefix, options))
+                chunk_paths.clear()
+                chunk_stats.clear()
+                while len(in_flight) > 4 * workers:
+                    collect(in_flight.popleft())
+            
+            for entry in _walk_files(options.folder_path):
+                path = entry.path
+                
+                # Check if any loader can handle this file
+                if not registry.can_load_file(path):
+                    continue
+                is_raw = is_raw_format(path)
+                total_files += 1
+                # Count RAW images separately
+                if is_raw:
+                    raw_files += 1
+                show_progress()
+                
+                file_stat = None
+                state = indexed.get(path)
+                if state is not None:
+                    try:
+                        file_stat = entry.stat()
+                    except OSError as e:
+                        record_result(walk_counts, ProcessImageResult(path=path, success=False, error=f"Cannot stat file {path}: {str(e)}"), is_raw)
+                        continue
+                    if _is_unchanged(state, file_stat):
+                        if options.debug_mode:
+                            logging.debug(f"Skipping unchanged image: {path}")
+                        if state[1] is None:
+                            legacy_unchanged.append((path, file_stat.st_mtime_ns))
+                        record_result(walk_counts, ProcessImageResult(path=path, success=True), is_raw)
+                        continue
+                
+                chunk_paths.append(path)
+                chunk_stats.append(file_stat)
+                if len(chunk_paths) >= SCAN_CHUNK_SIZE:
+                    submit_chunk()
+            
+            if chunk_paths:
+                submit_chunk()
+            while in_flight:
+                collect(in_flight.popleft())
+                show_progress()
+    finally:
+        write_queue.put(None)
+        writer_thread.join()
+        show_progress(final=True)
+    
+    processed = walk_counts.processed + write_counts.processed
+    errors = walk_counts.errors + write_counts.errors
+    raw_processed = walk_counts.raw_processed + write_counts.raw_processed
+    raw_errors = walk_counts.raw_errors + write_counts.raw_errors
+    
+    if options.debug_mode:
+        logging.debug(f"Found {total_files} image files to process ({raw_files} RAW files)")
+    
+    # Rows indexed before mtime_ns existed need the slower modified_at check;
+    # record their mtime_ns now that the files are known to be unchanged
+    try:
+        store_file_mtimes(db_conn, options.source_prefix, legacy_unchanged)
+    except Exception as e:
+        logging.warning(f"Could not record file modification times: {e}")
+    
+    # Final output
+    elapsed = time.time() - start_time
+    print("\nIndexing complete.")
+    
+    # Log final statistics
+    if options.debug_mode:
+        logging.debug(f"Scan completed in {elapsed:.2f}s. Processed: {processed}, Errors: {errors}, "
+                     f"RAW files: {raw_processed}, RAW errors: {raw_errors}")
+    
+    print(f"Found {total_files} image files (including {raw_files} RAW files).")
+    print(f"Processed {processed} images in {int(elapsed)} seconds.")
+    if raw_processed > 0:
+        print(f"Successfully processed {raw_processed-raw_errors}/{raw_files} RAW image files.")
+    
+    if errors > 0:
+        print(f"Encountered {errors} errors during indexing.")
+        print("Check the log file for details.")
+
+# Define aliases for compatibility with original Go code
+ScanAndStoreFolder = scan_and_store_folder
\ No newline at end of file
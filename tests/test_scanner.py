@@ -0,0 +1,66 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+from imagefinder.database import init_database
+from imagefinder.scanner import ScanOptions, scan_and_store_folder
+
+
+def _write_jpeg(path: str, seed: int, size: int) -> None:
+    rng = np.random.default_rng(seed)
+    cv2.imwrite(path, rng.integers(0, 256, (size, size, 3), dtype=np.uint8))
+
+
+class RescanTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.folder = os.path.join(self.tmp_dir, "images")
+        os.mkdir(self.folder)
+        self.db_conn = init_database(os.path.join(self.tmp_dir, "images.db"))
+
+    def tearDown(self):
+        self.db_conn.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def _scan(self) -> None:
+        options = ScanOptions(folder_path=self.folder, source_prefix="", force_rewrite=False,
+                              debug_mode=False, db_path="")
+        scan_and_store_folder(self.db_conn, options)
+
+    def _row(self, path: str) -> tuple:
+        return self.db_conn.execute(
+            "SELECT size, mtime_ns, average_hash, perceptual_hash FROM images WHERE path = ?",
+            (path,)).fetchone()
+
+    def test_rescan_updates_modified_file(self):
+        changed = os.path.join(self.folder, "changed.jpg")
+        unchanged = os.path.join(self.folder, "unchanged.jpg")
+        _write_jpeg(changed, seed=1, size=64)
+        _write_jpeg(unchanged, seed=2, size=64)
+        self._scan()
+        old_changed = self._row(changed)
+        old_unchanged = self._row(unchanged)
+
+        _write_jpeg(changed, seed=3, size=256)
+        stat = os.stat(changed)
+        os.utime(changed, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+        stat = os.stat(changed)
+        self._scan()
+
+        size, mtime_ns, average_hash, perceptual_hash = self._row(changed)
+        self.assertEqual(size, stat.st_size)
+        self.assertEqual(mtime_ns, stat.st_mtime_ns)
+        self.assertNotEqual((average_hash, perceptual_hash), old_changed[2:])
+        self.assertEqual(self._row(unchanged), old_unchanged)
+
+        # A third scan finds the stored row current and leaves it alone
+        self._scan()
+        self.assertEqual(self._row(changed), (size, mtime_ns, average_hash, perceptual_hash))
+
+
+if __name__ == "__main__":
+    unittest.main()